@@ -6,15 +6,22 @@ This script orchestrates data fetch -> TA -> scoring -> report -> email (optiona
 It selects historical periods appropriate to each mode so the screener's volatility windows and targets are meaningful.
 """
 import argparse
+import hashlib
 import logging
+import os
+import pickle
 import sys
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
 
-from src.data_fetcher import DataFetcher
+import numpy as np
+import pandas as pd
+
+from src.data_fetcher import DataFetcher, period_offset
 from src.technical_analysis import TechnicalAnalyzer
 from src.stock_screener import StockScreener
-from src.report_generator import ReportGenerator
+from src.report_generator import ReportGenerator, fmt_pct, fmt_price
 
 # Configure logging
 logging.basicConfig(
@@ -26,19 +33,12 @@ logger = logging.getLogger("main")
 
 ROOT = Path(__file__).parent
 
-# Formatting helpers
-def fmt_price(p):
-    try:
-        return f"₹{float(p):,.2f}"
-    except Exception:
-        return "N/A"
+# Bump when indicator/signal logic changes so cached TA results from older code are ignored
+TA_CACHE_VERSION = 7
+
+# Recommendation buckets in display order
+RECOMMENDATIONS = ("STRONG BUY", "BUY", "HOLD", "SELL")
 
-def fmt_pct(x):
-    try:
-        sign = "+" if x >= 0 else ""
-        return f"{sign}{float(x):.2f}%"
-    except Exception:
-        return "N/A"
 
 def print_console_report(report_meta):
     """
@@ -49,141 +49,215 @@ def print_console_report(report_meta):
         print("No items to display.")
         return
 
-    # Group
-    groups = {"STRONG BUY": [], "BUY": [], "HOLD": [], "SELL": []}
+    # Group (anything unrecognised lands in HOLD)
+    groups = {rec: [] for rec in RECOMMENDATIONS}
+    hold = groups["HOLD"]
     for it in all_items:
-        rec = (it.get("signals") or {}).get("recommendation", "HOLD")
-        if rec == "STRONG BUY":
-            groups["STRONG BUY"].append(it)
-        elif rec == "BUY":
-            groups["BUY"].append(it)
-        elif rec == "SELL":
-            groups["SELL"].append(it)
-        else:
-            groups["HOLD"].append(it)
-
-    timestamp = report_meta.get("timestamp", datetime.utcnow().strftime("%Y-%m-%d"))
-    print()
-    print(f"📅 {report_meta.get('folder').split('/')[-1].replace('_',' ')} — {timestamp}")
+        sig = it.get("signals")
+        rec = sig.get("recommendation", "HOLD") if sig else "HOLD"
+        groups.get(rec, hold).append(it)
+
+    timestamp = report_meta["timestamp"]
+    # Build the whole report as lines and emit it with a single write
+    buf = [""]
+    buf.append(f"📅 {report_meta.get('folder').split('/')[-1].replace('_',' ')} — {timestamp}")
     # Summary
     def avg_expected(items):
-        vals = [it.get("expected_return_pct") for it in items if it.get("expected_return_pct") is not None]
-        return round(sum(vals)/len(vals),2) if vals else None
+        vals = np.fromiter((x for x in (it.get("expected_return_pct") for it in items) if x is not None), dtype=np.float64)
+        return round(float(vals.mean()), 2) if vals.size else None
 
     total_items = len(all_items)
-    print("Summary:")
-    print(f"- Total scanned: {total_items}")
-    print(f"- Strong Buy: {len(groups['STRONG BUY'])} | Buy: {len(groups['BUY'])} | Hold: {len(groups['HOLD'])} | Sell: {len(groups['SELL'])}")
+    buf.append("Summary:")
+    buf.append(f"- Total scanned: {total_items}")
+    buf.append(f"- Strong Buy: {len(groups['STRONG BUY'])} | Buy: {len(groups['BUY'])} | Hold: {len(groups['HOLD'])} | Sell: {len(groups['SELL'])}")
     overall_avg = avg_expected(all_items)
     if overall_avg is not None:
-        print(f"- Avg Expected Return: {fmt_pct(overall_avg)}")
-    print()
+        buf.append(f"- Avg Expected Return: {fmt_pct(overall_avg)}")
+    buf.append("")
 
-    # Helper to print table-like rows
-    def print_section(title, items):
-        print(title)
+    header = f"{'Stock':<16} {'Price':>12} {'Target (range)':>28} {'Return':>10} {'Risk':>8} {'Sector':>15} {'Notes':>30}"
+    rule = "-" * len(header)
+
+    # Helper to add table-like rows
+    def add_section(title, items):
+        buf.append(title)
         if not items:
-            print("  (none)\n")
+            buf.append("  (none)\n")
             return
-        header = f"{'Stock':<16} {'Price':>12} {'Target (range)':>28} {'Return':>10} {'Risk':>8} {'Sector':>15} {'Notes':>30}"
-        print(header)
-        print("-" * len(header))
+        buf.append(header)
+        buf.append(rule)
         for it in items:
-            sym = it.get("symbol", "")
-            price = fmt_price(it.get("last_price"))
+            get = it.get
+            sym = get("symbol", "")
+            price = fmt_price(get("last_price"))
             # target range
-            t_low = it.get("target_low")
-            t_high = it.get("target_high")
+            t_low = get("target_low")
+            t_high = get("target_high")
+            target = get("target")
             tgt_s = "N/A"
             if t_low is not None and t_high is not None:
                 tgt_s = f"{fmt_price(t_low)} – {fmt_price(t_high)}"
-            elif it.get("target") is not None:
-                tgt_s = fmt_price(it.get("target"))
-            ret = fmt_pct(it.get("expected_return_pct")) if it.get("expected_return_pct") is not None else "N/A"
-            risk = it.get("risk", "N/A")
-            sector = it.get("sector", "N/A")
-            rationale = it.get("rationale", "")
+            elif target is not None:
+                tgt_s = fmt_price(target)
+            exp = get("expected_return_pct")
+            ret = fmt_pct(exp) if exp is not None else "N/A"
+            risk = get("risk", "N/A")
+            sector = get("sector", "N/A")
+            rationale = get("rationale", "")
             # limit rationale length
             if rationale and len(rationale) > 60:
                 rationale = rationale[:57] + "..."
-            print(f"{sym:<16} {price:>12} {tgt_s:>28} {ret:>10} {risk:>8} {sector:>15} {rationale:>30}")
-        print()
-
-    # Print in preferred order
-    print_section("🔥 Strong Buy", groups["STRONG BUY"])
-    print_section("🟩 Buy", groups["BUY"])
-    print_section("🟨 Hold", groups["HOLD"])
-    print_section("🔴 Sell", groups["SELL"])
+            buf.append(f"{sym:<16} {price:>12} {tgt_s:>28} {ret:>10} {risk:>8} {sector:>15} {rationale:>30}")
+        buf.append("")
 
+    # Sections in preferred order
+    add_section("🔥 Strong Buy", groups["STRONG BUY"])
+    add_section("🟩 Buy", groups["BUY"])
+    add_section("🟨 Hold", groups["HOLD"])
+    add_section("🔴 Sell", groups["SELL"])
 
-def run(mode: str):
-    mode = mode.lower()
-    allowed_modes = ["daily", "weekly", "monthly", "quarterly", "biquarterly", "yearly"]
-    if mode not in allowed_modes:
-        logger.error("Invalid mode '%s'. Allowed: %s", mode, ", ".join(allowed_modes))
-        return
+    sys.stdout.write("\n".join(buf) + "\n")
+    sys.stdout.flush()
 
-    logger.info("Starting Indian Stock Predictor - mode=%s", mode)
-
-    # Choose history lengths (period strings understood by yfinance)
-    # We'll pick conservative choices:
-    # - daily/weekly: 1 year of daily data
-    # - monthly/quarterly: 3 years (gives enough history for 60/120-day windows)
-    # - biquarterly/yearly: 5 years
-    period_map = {
-        "daily": "1y",
-        "weekly": "1y",
-        "monthly": "3y",
-        "quarterly": "3y",
-        "biquarterly": "5y",
-        "yearly": "5y"
-    }
-    interval_map = {
-        # Keep daily granularity; weekly/monthly analysis still benefits from daily history
-        "daily": "1d",
-        "weekly": "1d",
-        "monthly": "1d",
-        "quarterly": "1d",
-        "biquarterly": "1d",
-        "yearly": "1d"
-    }
-
-    period = period_map.get(mode, "1y")
-    interval = interval_map.get(mode, "1d")
 
-    # Initialize components
-    config_path = ROOT / "config" / "stocks_list.json"
-    fetcher = DataFetcher(config_path=config_path, historical_path=ROOT / "data" / "historical")
+def _compute_ta(sym, df):
+    """
+    Compute indicators + signals for one symbol.
+    Lives at module level so it can be pickled into ProcessPoolExecutor workers.
+    The frame arrives as a pickled copy, so no defensive df.copy() is needed here.
+    Only the screener's columns travel back, as ndarrays, instead of the whole TA frame.
+    """
     analyzer = TechnicalAnalyzer()
-    screener = StockScreener(config_path=config_path)
-    reports = ReportGenerator(root_reports=ROOT / "reports")
+    ta_df = analyzer.add_indicators(df)
+    signals = analyzer.generate_signals(ta_df)
+    return sym, analyzer.to_arrays(ta_df), signals
 
-    symbols = fetcher.list_all_symbols()
-    logger.info("Symbols count: %d", len(symbols))
 
-    # Fetch historical data appropriate for the mode
-    logger.info("Downloading history for period=%s interval=%s", period, interval)
-    hist_data = fetcher.fetch_batch(symbols, period=period, interval=interval)
-    logger.info("Downloaded historical data for %d symbols", len(hist_data))
+def _ta_cache_key(df):
+    """
+    Fingerprint of an OHLCV frame: last bar, row count and the raw Close bytes.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(f"v{TA_CACHE_VERSION}|{df.index[-1]}|{len(df)}|".encode())
+    h.update(df["Close"].to_numpy().tobytes())
+    return h.hexdigest()
+
 
-    # Compute indicators and signals
-    ta_results = {}
+def _ta_cache_file(cache_dir: Path, sym: str, key: str) -> Path:
+    safe = sym.replace("/", "_").replace("^", "")
+    return cache_dir / f"{safe}_{key}.pkl"
+
+
+def _load_cached_ta(cache_dir: Path, sym: str, key: str):
+    path = _ta_cache_file(cache_dir, sym, key)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        logger.debug("TA cache read failed for %s, recomputing", sym)
+        return None
+
+
+def _store_cached_ta(cache_dir: Path, sym: str, key: str, result: dict):
+    path = _ta_cache_file(cache_dir, sym, key)
+    try:
+        # drop this symbol's results for older bars before writing the new one
+        prefix = path.name.rsplit("_", 1)[0]
+        for old in cache_dir.glob(f"{prefix}_*.pkl"):
+            if old.name.rsplit("_", 1)[0] == prefix:
+                old.unlink()
+        with open(path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        logger.warning("Failed to write TA cache for %s", sym, exc_info=True)
+
+
+def compute_ta_parallel(hist_data, max_workers=None, cache_dir: Path = None):
+    """
+    Run _compute_ta for every non-empty symbol across a process pool (one task per symbol).
+    With cache_dir set, symbols whose OHLCV fingerprint matches a stored result are loaded
+    from disk instead of recomputed, and fresh results are stored for the next run.
+    Returns {symbol: {"arrays": {column: ndarray}, "signals": signals}} in the same order as hist_data.
+    """
+    jobs = {}
+    keys = {}
+    done = {}
     for sym, df in hist_data.items():
-        try:
-            if df is None or df.empty:
-                logger.warning("Empty data for %s, skipping TA", sym)
+        if df is None or df.empty:
+            logger.warning("Empty data for %s, skipping TA", sym)
+            continue
+        if cache_dir is not None:
+            keys[sym] = _ta_cache_key(df)
+            cached = _load_cached_ta(cache_dir, sym, keys[sym])
+            if cached is not None:
+                done[sym] = cached
                 continue
-            ta_df = analyzer.add_indicators(df.copy())
-            signals = analyzer.generate_signals(ta_df)
-            ta_results[sym] = {"df": ta_df, "signals": signals}
-        except Exception as e:
-            logger.exception("Failed to compute TA for %s: %s", sym, e)
+        jobs[sym] = df
+    hits = len(done)
+    if hits:
+        logger.info("TA cache hits: %d symbols", hits)
 
+    if jobs:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+            futures = {ex.submit(_compute_ta, s, d): s for s, d in jobs.items()}
+            for fut in as_completed(futures):
+                sym = futures[fut]
+                try:
+                    _, arrays, signals = fut.result()
+                    done[sym] = {"arrays": arrays, "signals": signals}
+                    if cache_dir is not None:
+                        _store_cached_ta(cache_dir, sym, keys[sym], done[sym])
+                except Exception as e:
+                    logger.exception("Failed to compute TA for %s: %s", sym, e)
+        logger.info("Computed TA for %d symbols", len(done) - hits)
+    # as_completed yields in finish order; restore input order so ranking ties stay deterministic
+    return {sym: done[sym] for sym in hist_data if sym in done}
+
+
+ALLOWED_MODES = ["daily", "weekly", "monthly", "quarterly", "biquarterly", "yearly"]
+
+# Choose history lengths (period strings understood by yfinance)
+# We'll pick conservative choices:
+# - daily/weekly: 1 year of daily data
+# - monthly/quarterly: 3 years (gives enough history for 60/120-day windows)
+# - biquarterly/yearly: 5 years
+PERIOD_MAP = {
+    "daily": "1y",
+    "weekly": "1y",
+    "monthly": "3y",
+    "quarterly": "3y",
+    "biquarterly": "5y",
+    "yearly": "5y"
+}
+INTERVAL_MAP = {
+    # Keep daily granularity; weekly/monthly analysis still benefits from daily history
+    "daily": "1d",
+    "weekly": "1d",
+    "monthly": "1d",
+    "quarterly": "1d",
+    "biquarterly": "1d",
+    "yearly": "1d"
+}
+
+
+def _longest_period(periods):
+    """
+    Longest of several yfinance period strings ("1y", "3y", ...).
+    """
+    anchor = datetime(2000, 1, 1)
+    return max(periods, key=lambda p: anchor + (period_offset(p) or pd.DateOffset(years=100)))
+
+
+def _report_mode(mode: str, ta_results: dict, screener, reports, timestamp: str):
+    """
+    Score the precomputed TA results for one mode, then write/print/send its report.
+    """
     # Score & rank (screener uses mode to pick volatility window)
     scoring_results = screener.score_universe(ta_results, mode=mode)
 
     # Generate report (timestamped)
-    timestamp = datetime.utcnow().strftime("%Y-%m-%d")
     report_meta = reports.generate_report(scoring_results, mode=mode, timestamp=timestamp)
 
     logger.info("Report generated: %s", report_meta["report_md"])
@@ -205,11 +279,65 @@ def run(mode: str):
     # Create GitHub issue in CI if applicable (report body uses markdown)
     reports.create_github_issue_if_ci(report_meta, mode=mode)
 
+
+def run_all(modes):
+    """
+    Run several modes off one pipeline: modes that share an interval share a single download
+    (at the longest period any of them needs) and a single TA pass; only scoring and
+    reporting run per mode.
+    """
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    modes = [m.lower() for m in modes]
+    invalid = [m for m in modes if m not in ALLOWED_MODES]
+    if invalid or not modes:
+        logger.error("Invalid mode(s) '%s'. Allowed: %s", ",".join(invalid), ", ".join(ALLOWED_MODES))
+        return
+
+    logger.info("Starting Indian Stock Predictor - modes=%s", ",".join(modes))
+
+    # Initialize components
+    config_path = ROOT / "config" / "stocks_list.json"
+    fetcher = DataFetcher(config_path=config_path, historical_path=ROOT / "data" / "historical")
+    screener = StockScreener(config_path=config_path)
+    reports = ReportGenerator(root_reports=ROOT / "reports")
+
+    symbols = fetcher.list_all_symbols()
+    logger.info("Symbols count: %d", len(symbols))
+
+    ta_cache_dir = ROOT / "data" / "ta_cache"
+    ta_cache_dir.mkdir(parents=True, exist_ok=True)
+
+    by_interval = {}
+    for mode in modes:
+        by_interval.setdefault(INTERVAL_MAP.get(mode, "1d"), []).append(mode)
+
+    for interval, group in by_interval.items():
+        period = _longest_period([PERIOD_MAP.get(m, "1y") for m in group])
+
+        # Fetch historical data long enough for every mode in the group
+        logger.info("Downloading history for period=%s interval=%s (modes: %s)", period, interval, ",".join(group))
+        hist_data = fetcher.fetch_batch(symbols, period=period, interval=interval)
+        logger.info("Downloaded historical data for %d symbols", len(hist_data))
+
+        # Compute indicators and signals (one process-pool task per symbol)
+        ta_results = compute_ta_parallel(hist_data, cache_dir=ta_cache_dir)
+
+        for mode in group:
+            _report_mode(mode, ta_results, screener, reports, timestamp)
+
     logger.info("Done.")
 
 
+def run(mode: str):
+    run_all([mode])
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Indian Stock Predictor - run scans")
-    parser.add_argument("--mode", choices=["daily", "weekly", "monthly", "quarterly", "biquarterly", "yearly"], default="daily", help="Mode to run")
+    parser.add_argument("--mode", choices=ALLOWED_MODES, default="daily", help="Mode to run")
+    parser.add_argument("--modes", default=None, help="Comma-separated modes to run off one download/TA pass, e.g. daily,weekly,monthly (overrides --mode)")
     args = parser.parse_args()
-    run(args.mode)
+    if args.modes:
+        run_all([m.strip() for m in args.modes.split(",") if m.strip()])
+    else:
+        run(args.mode)
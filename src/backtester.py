@@ -15,25 +15,36 @@ logger.setLevel(logging.INFO)
 
 def run_simple_long_backtest(price_series: pd.Series, entry_dates: List[pd.Timestamp], hold_days: int = 5):
     """
-    price_series: pd.Series indexed by Timestamp (Close)
+    price_series: pd.Series indexed by Timestamp (Close), sorted ascending
     entry_dates: list of entry timestamps
     Returns simple cumulative return assuming buy at next open/close and exit after hold_days.
+    All trades are evaluated at once: entry bars are located with one get_indexer(method="nearest")
+    call over the index and entry/exit prices are gathered by fancy indexing.
     """
-    returns = []
-    for d in entry_dates:
-        try:
-            entry_idx = price_series.index.get_loc(d, method="nearest")
-            entry_price = price_series.iloc[entry_idx]
-            exit_idx = min(entry_idx + hold_days, len(price_series) - 1)
-            exit_price = price_series.iloc[exit_idx]
-            rtn = (exit_price / entry_price) - 1.0
-            returns.append(rtn)
-        except Exception:
-            continue
-    if not returns:
+    n = len(price_series)
+    if n == 0 or len(entry_dates) == 0:
         return {"cagr": 0.0, "total_return": 0.0, "trades": 0}
-    total = np.prod([1 + r for r in returns]) - 1
+
+    # nearest bar to each entry date (ties go to the later bar); -1 marks dates that can't be placed
+    dates = pd.DatetimeIndex(entry_dates)
+    # get_indexer raises on tz-aware vs naive: naive dates are read as wall times in the index's
+    # timezone, and aware dates against a naive index keep their wall time
+    tz = getattr(price_series.index, "tz", None)
+    if tz is not None and dates.tz is None:
+        dates = dates.tz_localize(tz)
+    elif tz is None and dates.tz is not None:
+        dates = dates.tz_localize(None)
+    entry_idx = price_series.index.get_indexer(dates[dates.notna()], method="nearest")
+    entry_idx = entry_idx[entry_idx != -1]
+    if entry_idx.size == 0:
+        return {"cagr": 0.0, "total_return": 0.0, "trades": 0}
+    exit_idx = np.minimum(entry_idx + hold_days, n - 1)
+
+    p = price_series.to_numpy(dtype=np.float64)
+    returns = p[exit_idx] / p[entry_idx] - 1.0
+
+    total = np.prod(1.0 + returns) - 1
     # approximate CAGR assuming one trade per hold_days (very rough)
-    years = (len(price_series) / 252)
+    years = (n / 252)
     cagr = (1 + total) ** (1 / years) - 1 if years > 0 else total
-    return {"cagr": cagr, "total_return": total, "trades": len(returns), "avg_return": np.mean(returns)}
+    return {"cagr": cagr, "total_return": total, "trades": int(returns.size), "avg_return": returns.mean()}
@@ -1,14 +1,25 @@
 """
 data_fetcher.py
-- Uses yfinance.download for bulk downloads (fast)
-- Caches per-symbol CSVs in data/historical/
+- Uses yfinance.download for bulk downloads (fast), chunked at BULK_CHUNK_SIZE tickers per request
+- Caches per-symbol Parquet files in data/historical/ (legacy CSV caches are migrated on first read)
+- Cached history is reused only when it reaches the last completed trading day and covers the requested period
 - Falls back to threaded single-ticker fetch if bulk fails
+- Cache writes run on a background thread so they overlap with the remaining downloads
 - Includes simple retry/backoff
+- Yahoo requests share a token-bucket RateLimiter (one token per bulk chunk or per-symbol call),
+  so concurrency is bounded by request rate, not sleeps
+- load_config parses config/stocks_list.json once per process (re-parsed only if the file changes)
 """
+import functools
+import json
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
+import threading
 import time
 import pandas as pd
+from pandas.tseries.offsets import BDay
 import yfinance as yf
 import os
 from typing import Dict
@@ -16,34 +27,173 @@ from typing import Dict
 logger = logging.getLogger("data_fetcher")
 logger.setLevel(logging.INFO)
 
+# Tickers per yf.download request; keeps URLs and per-request payloads reasonable
+BULK_CHUNK_SIZE = 50
+# Yahoo request budget shared by all fetch paths, and worker threads for the per-symbol fallback
+REQUESTS_PER_SECOND = 8
+FALLBACK_WORKERS = 16
+# A cache "covers" a period if its first bar is within this many days of the period start
+# (the first trading day after the start can fall behind weekends/holidays)
+CACHE_START_SLACK_DAYS = 7
+
+_PERIOD_UNITS = {"d": "days", "wk": "weeks", "mo": "months", "y": "years"}
+
+
+def period_offset(period: str):
+    """
+    yfinance period string ("5d", "6mo", "1y", ...) -> pd.DateOffset; None for "max"/"ytd"/unknown.
+    """
+    m = re.fullmatch(r"(\d+)(d|wk|mo|y)", str(period).strip())
+    if not m:
+        return None
+    return pd.DateOffset(**{_PERIOD_UNITS[m.group(2)]: int(m.group(1))})
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_config(path: str, mtime_ns: int) -> dict:
+    return json.loads(Path(path).read_bytes())
+
+
+def load_config(config_path) -> dict:
+    """
+    Parsed JSON config, memoized on (path, mtime) so repeated DataFetcher/StockScreener
+    instances share one parse. The returned dict is shared: treat it as read-only.
+    """
+    path = Path(config_path)
+    return _parse_config(str(path.resolve()), path.stat().st_mtime_ns)
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: up to `rate` tokens per `per` seconds, bursting to `rate`.
+    """
+    def __init__(self, rate: float, per: float = 1.0):
+        self.capacity = float(rate)
+        self.fill_rate = rate / per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: int = 1):
+        """
+        Take `n` tokens, waiting until they are available; charges are capped at the burst size.
+        """
+        need = min(n, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= need:
+                    self.tokens -= need
+                    return
+                wait_s = (need - self.tokens) / self.fill_rate
+            time.sleep(wait_s)
+
 
 class DataFetcher:
     def __init__(self, config_path: Path = Path("config") / "stocks_list.json", historical_path: Path = Path("data") / "historical"):
         self.config_path = Path(config_path)
         self.historical_path = Path(historical_path)
         self.historical_path.mkdir(parents=True, exist_ok=True)
+        # background cache writer, created on the first queued write and shut down by flush_cache_writes
+        self._cache_writer = None
+        self._writer_lock = threading.Lock()
+        self._pending_writes = []
+        self._limiter = RateLimiter(REQUESTS_PER_SECOND)
 
     def _cache_path(self, symbol: str) -> Path:
         safe = symbol.replace("/", "_").replace("^", "")
-        return self.historical_path / f"{safe}.csv"
+        return self.historical_path / f"{safe}.parquet"
+
+    def _read_cache(self, symbol: str) -> pd.DataFrame:
+        """
+        Load the cached frame (index=Date) or None when nothing is cached.
+        A CSV left by older versions is read once and rewritten as Parquet.
+        """
+        path = self._cache_path(symbol)
+        if path.exists():
+            return pd.read_parquet(path).set_index("Date")
+        legacy = path.with_suffix(".csv")
+        if legacy.exists():
+            df = pd.read_csv(legacy, parse_dates=["Date"], index_col="Date")
+            logger.info("Migrating CSV cache for %s to Parquet", symbol)
+            self._write_cache(symbol, df)
+            return df
+        return None
+
+    def _load_fresh_cache(self, symbol: str, period: str) -> pd.DataFrame:
+        """
+        Cached frame trimmed to `period`, or None if there is no cache or it is stale/too short:
+          - its last bar is older than the previous business day, or
+          - its first bar starts after the period start (e.g. 1y cached, 5y requested).
+        """
+        try:
+            df = self._read_cache(symbol)
+        except Exception:
+            logger.debug("Cache read failed for %s, refetching", symbol)
+            return None
+        if df is None or df.empty or not isinstance(df.index, pd.DatetimeIndex):
+            return None
+        idx = df.index.tz_localize(None) if df.index.tz is not None else df.index
+        today = pd.Timestamp.now(tz="UTC").tz_localize(None).normalize()
+        if idx.max().normalize() < today - BDay(1):
+            return None
+        offset = period_offset(period)
+        if offset is None:
+            return df
+        start = today - offset
+        if idx.min() > start + pd.Timedelta(days=CACHE_START_SLACK_DAYS):
+            return None
+        return df[idx >= start]
+
+    def _write_cache(self, symbol: str, df: pd.DataFrame):
+        """
+        Persist df (index=Date) as Parquet. Failures are logged, never raised:
+        a cache miss next run is cheaper than losing freshly downloaded data.
+        """
+        path = self._cache_path(symbol)
+        try:
+            df.rename_axis("Date").reset_index().to_parquet(path, engine="pyarrow", compression="snappy", index=False)
+        except Exception:
+            logger.warning("Failed to write cache for %s at %s", symbol, path, exc_info=True)
+
+    def _write_cache_async(self, symbol: str, df: pd.DataFrame):
+        """
+        Queue a cache write; callers keep using df in memory (it must not be mutated afterwards).
+        """
+        with self._writer_lock:
+            if self._cache_writer is None:
+                self._cache_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-write")
+            self._pending_writes.append(self._cache_writer.submit(self._write_cache, symbol, df))
+
+    def flush_cache_writes(self):
+        """
+        Block until every queued cache write has finished, then stop the writer threads
+        (so none are alive if the caller forks worker processes next).
+        """
+        with self._writer_lock:
+            writer, self._cache_writer = self._cache_writer, None
+            pending, self._pending_writes = self._pending_writes, []
+        wait(pending)
+        if writer is not None:
+            writer.shutdown(wait=True)
 
     def list_all_symbols(self):
-        import json
         try:
-            with open(self.config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-                syms = []
-                syms.extend(config.get("nifty50", []))
-                syms.extend(config.get("midcap", []))
-                syms.extend(config.get("indices", []))
-                # remove duplicates preserving order
-                seen = set()
-                out = []
-                for s in syms:
-                    if s not in seen:
-                        seen.add(s)
-                        out.append(s)
-                return out
+            config = load_config(self.config_path)
+            syms = []
+            syms.extend(config.get("nifty50", []))
+            syms.extend(config.get("midcap", []))
+            syms.extend(config.get("indices", []))
+            # remove duplicates preserving order
+            seen = set()
+            out = []
+            for s in syms:
+                if s not in seen:
+                    seen.add(s)
+                    out.append(s)
+            return out
         except Exception as e:
             logger.exception("Failed to load config symbols: %s", e)
             return []
@@ -52,28 +202,23 @@ class DataFetcher:
         """
         Fetch single symbol with cache and retry.
         """
-        path = self._cache_path(symbol)
-        # try cache first
-        if path.exists():
-            try:
-                df = pd.read_csv(path, parse_dates=["Date"], index_col="Date")
-                if not df.empty:
-                    return df
-            except Exception:
-                logger.debug("Cache read failed for %s, refetching", symbol)
+        # try cache first (only if fresh and long enough for `period`)
+        df = self._load_fresh_cache(symbol, period)
+        if df is not None:
+            return df
 
         # fetch with retry
         attempts = 3
         for attempt in range(attempts):
             try:
+                self._limiter.acquire()
                 ticker = yf.Ticker(symbol)
                 df = ticker.history(period=period, interval=interval, actions=False)
                 if df is None or df.empty:
                     raise ValueError("No data returned")
                 # normalize index and save
-                df = df.rename_axis("Date").reset_index()
-                df.to_csv(path, index=False)
-                df = pd.read_csv(path, parse_dates=["Date"], index_col="Date")
+                df = df.rename_axis("Date").reset_index().set_index("Date")
+                self._write_cache_async(symbol, df)
                 return df
             except Exception as e:
                 wait = 1 + attempt * 2
@@ -84,48 +229,88 @@ class DataFetcher:
 
     def fetch_batch(self, symbols, period: str = "1y", interval: str = "1d") -> Dict[str, pd.DataFrame]:
         """
-        Attempt bulk download using yfinance.download, write caches.
-        Fallback: threaded fetch_history per symbol.
+        Serve symbols with a fresh cache from disk; bulk download the rest using yfinance.download
+        in chunks of BULK_CHUNK_SIZE tickers, write caches.
+        Fallback: threaded fetch_history for chunks that fail outright and for symbols
+        whose bulk sub-frame came back empty.
         """
         out = {}
         symbols = list(symbols)
         if not symbols:
             return out
 
-        try:
-            logger.info("Attempting bulk download for %d symbols", len(symbols))
-            # yfinance allows space-separated tickers
-            joined = " ".join(symbols)
-            df_all = yf.download(tickers=joined, period=period, interval=interval, group_by="ticker", threads=True, auto_adjust=False, progress=False)
-            # If MultiIndex columns -> multiple tickers
-            if hasattr(df_all.columns, "levels") and len(df_all.columns.levels) > 0:
-                for sym in symbols:
-                    try:
-                        sub = df_all[sym].dropna(how="all")
-                        if sub.empty:
-                            logger.warning("Bulk download gave empty for %s; fallback to per-symbol", sym)
-                            out[sym] = self.fetch_history(sym, period=period, interval=interval)
-                            continue
-                        # ensure date index, save cache
-                        sub = sub.rename_axis("Date").reset_index().set_index("Date")
-                        sub.to_csv(self._cache_path(sym), index=True)
-                        out[sym] = sub
-                    except Exception:
-                        logger.exception("Error reading bulk data for %s; falling back", sym)
-                        out[sym] = self.fetch_history(sym, period=period, interval=interval)
+        to_download = []
+        for sym in symbols:
+            cached = self._load_fresh_cache(sym, period)
+            if cached is not None:
+                out[sym] = cached
             else:
-                # single ticker result (or unknown structure)
-                # Apply the same df to each symbol conservatively (likely only one symbol requested)
-                for sym in symbols:
-                    out[sym] = df_all.copy()
+                to_download.append(sym)
+        if out:
+            logger.info("Using fresh cache for %d of %d symbols", len(out), len(symbols))
+
+        chunks = [to_download[i:i + BULK_CHUNK_SIZE] for i in range(0, len(to_download), BULK_CHUNK_SIZE)]
+        fallback = []
+        for n, chunk in enumerate(chunks, start=1):
+            try:
+                logger.info("Bulk download chunk %d/%d (%d symbols)", n, len(chunks), len(chunk))
+                got, missing = self._download_chunk(chunk, period=period, interval=interval)
+                out.update(got)
+                fallback.extend(missing)
+            except Exception as e:
+                logger.warning("Bulk download failed for chunk %d (%s). Falling back to threaded per-symbol fetch.", n, e)
+                fallback.extend(chunk)
+        if chunks:
             logger.info("Bulk download completed")
-            return out
-        except Exception as e:
-            logger.warning("Bulk download failed (%s). Falling back to threaded per-symbol fetch.", e)
 
-        # Threaded fallback
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        with ThreadPoolExecutor(max_workers=6) as ex:
+        if fallback:
+            out.update(self._fetch_threaded(fallback, period=period, interval=interval))
+        # finish cache writes here so no writer thread is still running when callers fork workers
+        self.flush_cache_writes()
+        # keep caller's symbol order regardless of which path produced each frame
+        return {s: out[s] for s in symbols if s in out}
+
+    def _download_chunk(self, symbols, period: str, interval: str):
+        """
+        One yf.download round-trip for a chunk of symbols.
+        Returns ({symbol: df}, [symbols that need a per-symbol fetch]).
+        """
+        out = {}
+        missing = []
+        # yfinance allows space-separated tickers
+        joined = " ".join(symbols)
+        # one token per bulk chunk; the per-symbol Ticker.history path is charged per request
+        self._limiter.acquire()
+        df_all = yf.download(tickers=joined, period=period, interval=interval, group_by="ticker", threads=True, auto_adjust=False, progress=False)
+        # If MultiIndex columns -> multiple tickers
+        if hasattr(df_all.columns, "levels") and len(df_all.columns.levels) > 0:
+            for sym in symbols:
+                try:
+                    sub = df_all[sym].dropna(how="all")
+                    if sub.empty:
+                        logger.warning("Bulk download gave empty for %s; fallback to per-symbol", sym)
+                        missing.append(sym)
+                        continue
+                    # ensure date index, save cache
+                    sub = sub.rename_axis("Date").reset_index().set_index("Date")
+                    self._write_cache_async(sym, sub)
+                    out[sym] = sub
+                except Exception:
+                    logger.exception("Error reading bulk data for %s; falling back", sym)
+                    missing.append(sym)
+        else:
+            # single ticker result (or unknown structure)
+            # Apply the same df to each symbol conservatively (likely only one symbol requested)
+            for sym in symbols:
+                out[sym] = df_all.copy()
+        return out, missing
+
+    def _fetch_threaded(self, symbols, period: str, interval: str) -> Dict[str, pd.DataFrame]:
+        """
+        Threaded per-symbol fallback via fetch_history.
+        """
+        out = {}
+        with ThreadPoolExecutor(max_workers=FALLBACK_WORKERS) as ex:
             futures = {ex.submit(self.fetch_history, s, period, interval): s for s in symbols}
             for fut in as_completed(futures):
                 s = futures[fut]
@@ -1,58 +1,192 @@
 """
 modeling.py
-- Lightweight training skeleton using RandomForestRegressor
+- Lightweight training skeleton using HistGradientBoostingRegressor (histogram-binned boosted trees)
 - Prepares features from TA-enriched dataframe and persists models
+- Feature matrices are memoized on disk (MODEL_DIR/_feat_cache) keyed by a fingerprint of the inputs
+- train_all trains many symbols in parallel worker processes (one thread each) instead of threading inside one model
 - NOTE: This is a starting point for experimentation and offline training
 """
+import hashlib
+import os
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.model_selection import TimeSeriesSplit, cross_val_score
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler
 import joblib
+from joblib import Parallel, delayed
+from threadpoolctl import threadpool_limits
 import logging
 
+from src import ta_kernels
+
 logger = logging.getLogger("modeling")
 logger.setLevel(logging.INFO)
 
 MODEL_DIR = Path("data") / "models"
 MODEL_DIR.mkdir(parents=True, exist_ok=True)
+FEATURE_CACHE_DIR = MODEL_DIR / "_feat_cache"
+# joblib compression for saved models: zlib level 3 (stdlib, no extra dependency). Boosted-tree
+# models are small node arrays, so compact files beat memory-mapping them; set 0 to allow mmap loads.
+MODEL_COMPRESS = ("zlib", 3)
+# Bump when the feature definitions change so stale cached matrices are recomputed
+FEATURE_CACHE_VERSION = 3
+
+
+# Model inputs, in column order
+FEATURES = ["rsi_14", "macd_diff", "mom_5", "mom_20", "sma20_slope", "sma50_slope", "vol_20"]
+# TA columns read from the input frame; any that are missing default to 0.0
+TA_INPUTS = ["rsi_14", "macd_diff", "mom_5", "mom_20", "sma20", "sma50"]
+
+
+def _fill0(x: np.ndarray) -> np.ndarray:
+    return np.where(np.isnan(x), 0.0, x)
+
+
+def _feature_inputs(df: pd.DataFrame):
+    ta = df.reindex(columns=TA_INPUTS, fill_value=0.0).to_numpy(dtype=np.float64)
+    close = df["Close"].to_numpy(dtype=np.float64)
+    return ta, close
+
+
+def _feature_arrays(ta: np.ndarray, close: np.ndarray):
+    """
+    (X, y, keep): features and target for the rows where both are defined, plus the boolean row mask.
+    """
+    n = close.size
+    X = np.empty((n, len(FEATURES)))
+    X[:, :4] = ta[:, :4]
+    X[:, 4] = _fill0(ta_kernels.pct_change(ta[:, 4], 5))
+    X[:, 5] = _fill0(ta_kernels.pct_change(ta[:, 5], 10))
+    X[:, 6] = _fill0(ta_kernels.rolling_std(ta_kernels.pct_change(close, 1), 20))
+
+    # Target: return over the next 5 bars
+    ret_5 = ta_kernels.pct_change(close, 5)
+    y = np.full(n, np.nan)
+    y[:max(n - 5, 0)] = ret_5[5:]
+
+    keep = ~np.isnan(X).any(axis=1) & ~np.isnan(y)
+    return X[keep], y[keep], keep
+
+
+def _wrap_features(X: np.ndarray, y: np.ndarray, index: pd.Index):
+    # copy=False: the frame wraps the C-contiguous float64 buffer as-is, so X.to_numpy() hands the
+    # estimator that same buffer (pandas would otherwise copy it into a transposed block)
+    return (pd.DataFrame(X, index=index, columns=FEATURES, copy=False),
+            pd.Series(y, index=index, name="ret_5", copy=False))
 
 
 def prepare_features(df: pd.DataFrame):
-    df = df.copy()
-    # Ensure expected TA columns exist — if not, attempt safe defaults
-    for col in ["rsi_14", "macd_diff", "mom_5", "mom_20", "sma20", "sma50"]:
-        if col not in df.columns:
-            df[col] = 0.0
-    df["ret_1"] = df["Close"].pct_change(1)
-    df["ret_5"] = df["Close"].pct_change(5)
-    df["sma20_slope"] = df["sma20"].pct_change(5).fillna(0)
-    df["sma50_slope"] = df["sma50"].pct_change(10).fillna(0)
-    df["vol_20"] = df["Close"].pct_change().rolling(20).std().fillna(0)
-    features = ["rsi_14", "macd_diff", "mom_5", "mom_20", "sma20_slope", "sma50_slope", "vol_20"]
-    X = df[features].dropna()
-    y = df["ret_5"].shift(-5).reindex(X.index)
-    mask = y.notna()
-    return X.loc[mask], y.loc[mask]
-
-
-def train_for_symbol(symbol: str, df: pd.DataFrame, n_estimators: int = 100):
-    X, y = prepare_features(df)
+    """
+    Feature matrix X (FEATURES columns) and 5-bar forward return y, restricted to rows where both are defined.
+    Works on ndarrays: only Close and the TA_INPUTS columns are read and the input frame is left untouched.
+    """
+    X, y, keep = _feature_arrays(*_feature_inputs(df))
+    return _wrap_features(X, y, df.index[keep])
+
+
+def load_or_prepare_features(symbol: str, df: pd.DataFrame, cache_dir: Path = FEATURE_CACHE_DIR):
+    """
+    prepare_features memoized on disk: one .npz per symbol holding X, y and the row mask, reused
+    while the fingerprint of the input arrays (Close + TA_INPUTS) is unchanged.
+    """
+    ta, close = _feature_inputs(df)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"v{FEATURE_CACHE_VERSION}|{len(df)}|".encode())
+    h.update(ta.tobytes())
+    h.update(close.tobytes())
+    key = h.hexdigest()
+
+    path = cache_dir / f"{symbol.replace('/', '_').replace('^', '')}.npz"
+    if path.exists():
+        try:
+            with np.load(path) as cached:
+                if str(cached["key"]) == key:
+                    return _wrap_features(cached["X"], cached["y"], df.index[cached["keep"]])
+        except Exception:
+            logger.debug("Feature cache read failed for %s, recomputing", symbol)
+
+    X, y, keep = _feature_arrays(ta, close)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, key=np.array(key), X=X, y=y, keep=keep)
+        os.replace(tmp, path)
+    except Exception:
+        logger.warning("Failed to write feature cache for %s", symbol, exc_info=True)
+    return _wrap_features(X, y, df.index[keep])
+
+
+def model_path(symbol: str) -> Path:
+    return MODEL_DIR / f"{symbol.replace('/', '_')}_hgb.joblib"
+
+
+def load_model(symbol: str, mmap_mode: str = None):
+    """
+    Load a saved model for `symbol`, or None if it hasn't been trained.
+    mmap_mode (e.g. "r") only applies to files saved with MODEL_COMPRESS = 0: joblib can't
+    memory-map compressed pickles (it warns and loads them into memory instead).
+    """
+    path = model_path(symbol)
+    if not path.exists():
+        return None
+    try:
+        return joblib.load(path, mmap_mode=mmap_mode)
+    except Exception:
+        logger.exception("Failed to load model %s", path)
+        return None
+
+
+def train_for_symbol(symbol: str, df: pd.DataFrame, n_estimators: int = 100, cv_jobs: int = None):
+    """
+    Cross-validate and fit one model for `symbol`, save it under MODEL_DIR and return the path.
+    cv_jobs: processes for the CV folds (default: one per fold); train_all passes 1 since it
+    already parallelizes over symbols.
+    """
+    X, y = load_or_prepare_features(symbol, df)
     if X.empty:
         logger.warning("No training data for %s", symbol)
         return None
-    pipeline = Pipeline([
-        ("scaler", StandardScaler()),
-        ("rf", RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=-1))
-    ])
+    # Trees are scale-invariant, so no scaler; features are binned once (max_bins) and splits
+    # are found from histograms. n_estimators caps the boosting iterations.
+    model = HistGradientBoostingRegressor(max_iter=n_estimators, max_bins=255, random_state=42)
+    # CV folds slice plain C-contiguous arrays instead of DataFrames (no per-fold iloc/feature-name checks).
+    # Kept float64: HistGradientBoosting validates X to float64 before binning, so float32 would add a copy.
+    X_arr = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+    y_arr = y.to_numpy(dtype=np.float64)
     tscv = TimeSeriesSplit(n_splits=5)
-    scores = cross_val_score(pipeline, X, y, cv=tscv, scoring="neg_mean_squared_error")
+    # Folds are independent fits, so they run side by side; joblib caps each worker's OpenMP threads
+    # to its share of the cores, so the folds don't oversubscribe
+    scores = cross_val_score(model, X_arr, y_arr, cv=tscv, scoring="neg_mean_squared_error",
+                             n_jobs=cv_jobs or tscv.get_n_splits(), pre_dispatch="n_jobs")
     logger.info("Symbol %s CV MSE: %.6f (mean)", symbol, -scores.mean())
-    pipeline.fit(X, y)
-    out = MODEL_DIR / f"{symbol.replace('/', '_')}_rf.joblib"
-    joblib.dump(pipeline, out)
+    model.fit(X, y)
+    out = model_path(symbol)
+    joblib.dump(model, out, compress=MODEL_COMPRESS)
     logger.info("Saved model: %s", out)
     return out
+
+
+def _train_worker(symbol: str, df: pd.DataFrame, n_estimators: int):
+    # One OpenMP/BLAS thread per worker: the parallelism comes from training symbols side by side
+    try:
+        with threadpool_limits(limits=1):
+            return train_for_symbol(symbol, df, n_estimators=n_estimators, cv_jobs=1)
+    except Exception:
+        logger.exception("Training failed for %s", symbol)
+        return None
+
+
+def train_all(symbol_to_df: dict, n_estimators: int = 100, n_jobs: int = None):
+    """
+    Train one model per symbol across worker processes (joblib/loky).
+    Returns {symbol: saved model path, or None if the symbol had no data or failed}.
+    """
+    items = list(symbol_to_df.items())
+    if not items:
+        return {}
+    paths = Parallel(n_jobs=n_jobs or os.cpu_count(), prefer="processes", batch_size="auto")(
+        delayed(_train_worker)(sym, df, n_estimators) for sym, df in items
+    )
+    return {sym: path for (sym, _), path in zip(items, paths)}
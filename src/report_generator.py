@@ -10,36 +10,83 @@ report_generator.py
   * Locally: will prompt interactively for Gmail + App Password if EMAIL_* env vars absent
 - Creates GitHub Issue in CI (assigns repo owner if available) with the generated Markdown as the issue body
 """
+import html
+from collections import Counter
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
-import csv
+import math
+import numbers
 import os
 import smtplib
 from email.message import EmailMessage
-from email.mime.base import MIMEBase
-from email import encoders
 from email.utils import formataddr
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Any
 
 logger = logging.getLogger("report_generator")
 logger.setLevel(logging.INFO)
 
-# Helper formatters
+# Shared session for GitHub API calls: pooled keep-alive connections plus retry/backoff.
+# Retry's default allowed_methods leave POST out of status/read retries, so a 5xx after the
+# server accepted an issue can't create a duplicate; failed connects are still retried.
+_gh_session = requests.Session()
+_gh_session.mount("https://", HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))))
+_gh_session.headers.update({"Accept": "application/vnd.github+json"})
+
+# Helper formatters: None, NaN and non-numeric values render as "N/A"
+def _is_number(x) -> bool:
+    return isinstance(x, numbers.Real) and not math.isnan(x)
+
+
 def fmt_price(p):
-    try:
-        return f"₹{p:,.2f}"
-    except Exception:
+    if not _is_number(p):
         return "N/A"
+    return f"₹{p:,.2f}"
 
 
 def fmt_pct(x):
-    try:
-        sign = "+" if x >= 0 else ""
-        return f"{sign}{x:.2f}%"
-    except Exception:
+    if not _is_number(x):
         return "N/A"
+    sign = "+" if x >= 0 else ""
+    return f"{sign}{x:.2f}%"
+
+
+CSV_COLUMNS = [
+    "rank", "symbol", "score", "last_price", "target", "target_low", "target_high",
+    "expected_return_pct", "volatility", "risk", "sector", "recommendation", "rationale"
+]
+
+
+def _csv_row(rank: int, item: dict) -> tuple:
+    """
+    One CSV_COLUMNS row for a scored item (each field looked up once).
+    """
+    get = item.get
+    s = get("signals", {})
+    return (
+        rank, get("symbol"), get("score"), get("last_price"), get("target"), get("target_low"),
+        get("target_high"), get("expected_return_pct"), get("volatility"), get("risk"), get("sector"),
+        s.get("recommendation") if isinstance(s, dict) else None,
+        get("rationale")
+    )
+
+
+# Per-stock markdown blocks, filled with str.format_map
+SECTION_ROW_TMPL = "| **{symbol}** | {price} | {target} | {ret} | {risk} | {sector} | {notes} |\n"
+DETAIL_TMPL = (
+    "### {idx}. {symbol} — Score: {score}\n"
+    "- **Price:** {price}\n"
+    "{target_line}"
+    "- **Expected Return:** {ret}\n"
+    "- **Volatility (20d):** {volatility}\n"
+    "- **Risk:** {risk}\n"
+    "- **Sector:** {sector}\n"
+    "- **Rationale:** {rationale}\n\n"
+)
 
 
 class ReportGenerator:
@@ -60,61 +107,35 @@ class ReportGenerator:
           - CSV export (flat)
         Returns metadata dict with paths and lists.
         """
-        timestamp = timestamp or datetime.utcnow().strftime("%Y-%m-%d")
+        timestamp = timestamp or datetime.now(timezone.utc).strftime("%Y-%m-%d")
         folder = self._ensure_dir(mode, timestamp)
 
         top = scoring_results.get("top", [])
         all_items = scoring_results.get("all", [])
 
-        # CSV export (flat)
+        # One pass over all_items: CSV rows, recommendation groups and the expected-return average
+        csv_rows = []
+        groups = {"STRONG BUY": [], "BUY": [], "HOLD": [], "SELL": []}
+        hold = groups["HOLD"]
+        exp_sum, exp_n = 0.0, 0
+        for i, item in enumerate(all_items, start=1):
+            csv_rows.append(_csv_row(i, item))
+            groups.get(item.get("signals", {}).get("recommendation", "HOLD"), hold).append(item)
+            exp = item.get("expected_return_pct")
+            if exp is not None:
+                exp_sum += exp
+                exp_n += 1
+        overall_avg = round(exp_sum / exp_n, 2) if exp_n else None
+
+        # CSV export (flat): one DataFrame, serialized by pandas' C writer
         csv_path = folder / f"{mode}_predictions_{timestamp}.csv"
         try:
-            with open(csv_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    "rank", "symbol", "score", "last_price", "target", "target_low", "target_high",
-                    "expected_return_pct", "volatility", "risk", "sector", "recommendation", "rationale"
-                ])
-                for i, item in enumerate(all_items, start=1):
-                    s = item.get("signals", {})
-                    writer.writerow([
-                        i,
-                        item.get("symbol"),
-                        item.get("score"),
-                        item.get("last_price"),
-                        item.get("target"),
-                        item.get("target_low"),
-                        item.get("target_high"),
-                        item.get("expected_return_pct"),
-                        item.get("volatility"),
-                        item.get("risk"),
-                        item.get("sector"),
-                        s.get("recommendation") if isinstance(s, dict) else None,
-                        item.get("rationale")
-                    ])
+            # CRLF line endings, as csv.writer produced, so the exported file is byte-for-byte unchanged
+            pd.DataFrame(csv_rows, columns=CSV_COLUMNS).to_csv(csv_path, index=False, lineterminator="\r\n", encoding="utf-8")
         except Exception:
             logger.exception("Failed to write CSV to %s", csv_path)
 
-        # Build grouped lists by recommendation
-        groups = {"STRONG BUY": [], "BUY": [], "HOLD": [], "SELL": []}
-        for item in all_items:
-            rec = item.get("signals", {}).get("recommendation", "HOLD")
-            if rec == "STRONG BUY":
-                groups["STRONG BUY"].append(item)
-            elif rec == "BUY":
-                groups["BUY"].append(item)
-            elif rec == "SELL":
-                groups["SELL"].append(item)
-            else:
-                groups["HOLD"].append(item)
-
         # Summary lines
-        def avg_expected(items):
-            vals = [it.get("expected_return_pct") for it in items if it.get("expected_return_pct") is not None]
-            if not vals:
-                return None
-            return round(sum(vals) / len(vals), 2)
-
         summary_lines = [
             f"**Date:** {timestamp}",
             f"- Strong Buy: {len(groups['STRONG BUY'])}",
@@ -122,79 +143,87 @@ class ReportGenerator:
             f"- Hold: {len(groups['HOLD'])}",
             f"- Sell: {len(groups['SELL'])}"
         ]
-        overall_avg = avg_expected(all_items)
         if overall_avg is not None:
             summary_lines.append(f"- Avg Expected Return: {fmt_pct(overall_avg)}")
 
         # Markdown generation
         md_path = folder / f"{mode}_report_{timestamp}.md"
+        md_text = ""
         try:
+            # Collected into a list of chunks and written with a single write at the end
+            parts = []
+            w = parts.append
+            w(f"# 📈 {mode.capitalize()} Stock Predictions — {timestamp}\n\n")
+            w("## Summary\n")
+            for line in summary_lines:
+                w(f"- {line}\n")
+            w("\n---\n\n")
+
+            # Formatted fields per item, built once: the top 20 appear in both a section table and the appendix
+            formatted = {}
+
+            def fields(it):
+                f = formatted.get(id(it))
+                if f is None:
+                    get = it.get
+                    t_low, t_high, tgt = get("target_low"), get("target_high"), get("target")
+                    if t_low is not None and t_high is not None:
+                        tgt_s = f"{fmt_price(t_low)} – {fmt_price(t_high)}"
+                        target_line = f"- **Target Range:** {tgt_s}\n"
+                    elif tgt is not None:
+                        tgt_s = fmt_price(tgt)
+                        target_line = f"- **Target:** {tgt_s}\n"
+                    else:
+                        tgt_s = "N/A"
+                        target_line = ""
+                    f = formatted[id(it)] = {
+                        "symbol": get("symbol"),
+                        "score": get("score"),
+                        "price": fmt_price(get("last_price")),
+                        "target": tgt_s,
+                        "target_line": target_line,
+                        "ret": fmt_pct(get("expected_return_pct")),
+                        "volatility": get("volatility"),
+                        "risk": get("risk"),
+                        "sector": get("sector"),
+                        "rationale": get("rationale"),
+                        "notes": get("rationale") or "",
+                    }
+                return f
+
+            # Helper to write a table-like block
+            def write_section(title: str, items: list):
+                w(f"## {title}\n\n")
+                if not items:
+                    w("_No picks in this category_\n\n")
+                    return
+                # Header
+                w("| Stock | Price | Target (range) | Return | Risk | Sector | Notes |\n")
+                w("|---|---:|---|---:|---|---|---|\n")
+                for it in items:
+                    w(SECTION_ROW_TMPL.format_map(fields(it)))
+                w("\n")
+
+            # Order: Strong Buy, Buy, Hold, Sell
+            write_section("🔥 Strong Buy", groups["STRONG BUY"])
+            write_section("🟩 Buy", groups["BUY"])
+            write_section("🟨 Hold", groups["HOLD"])
+            write_section("🔴 Sell", groups["SELL"])
+
+            # Appendix with top details
+            w("---\n\n")
+            w("## 🧾 Detailed Top Picks (Top 20)\n\n")
+            for idx, it in enumerate(all_items[:20], start=1):
+                w(DETAIL_TMPL.format_map({**fields(it), "idx": idx}))
+            md_text = "".join(parts)
             with open(md_path, "w", encoding="utf-8") as f:
-                f.write(f"# 📈 {mode.capitalize()} Stock Predictions — {timestamp}\n\n")
-                f.write("## Summary\n")
-                for line in summary_lines:
-                    f.write(f"- {line}\n")
-                f.write("\n---\n\n")
-
-                # Helper to write a table-like block
-                def write_section(title: str, items: list):
-                    f.write(f"## {title}\n\n")
-                    if not items:
-                        f.write("_No picks in this category_\n\n")
-                        return
-                    # Header
-                    f.write("| Stock | Price | Target (range) | Return | Risk | Sector | Notes |\n")
-                    f.write("|---|---:|---|---:|---|---|---|\n")
-                    for it in items:
-                        sym = it.get("symbol")
-                        price = it.get("last_price")
-                        tgt = it.get("target")
-                        t_low = it.get("target_low")
-                        t_high = it.get("target_high")
-                        exp = it.get("expected_return_pct")
-                        risk = it.get("risk")
-                        sector = it.get("sector")
-                        rationale = it.get("rationale") or ""
-                        price_s = fmt_price(price) if price is not None else "N/A"
-                        if t_low is not None and t_high is not None:
-                            tgt_s = f"{fmt_price(t_low)} – {fmt_price(t_high)}"
-                        elif tgt is not None:
-                            tgt_s = fmt_price(tgt)
-                        else:
-                            tgt_s = "N/A"
-                        exp_s = fmt_pct(exp) if exp is not None else "N/A"
-                        f.write(f"| **{sym}** | {price_s} | {tgt_s} | {exp_s} | {risk} | {sector} | {rationale} |\n")
-                    f.write("\n")
-
-                # Order: Strong Buy, Buy, Hold, Sell
-                write_section("🔥 Strong Buy", groups["STRONG BUY"])
-                write_section("🟩 Buy", groups["BUY"])
-                write_section("🟨 Hold", groups["HOLD"])
-                write_section("🔴 Sell", groups["SELL"])
-
-                # Appendix with top details
-                f.write("---\n\n")
-                f.write("## 🧾 Detailed Top Picks (Top 20)\n\n")
-                for idx, it in enumerate(all_items[:20], start=1):
-                    f.write(f"### {idx}. {it.get('symbol')} — Score: {it.get('score')}\n")
-                    f.write(f"- **Price:** {fmt_price(it.get('last_price'))}\n")
-                    if it.get('target_low') is not None and it.get('target_high') is not None:
-                        f.write(f"- **Target Range:** {fmt_price(it.get('target_low'))} – {fmt_price(it.get('target_high'))}\n")
-                    elif it.get('target') is not None:
-                        f.write(f"- **Target:** {fmt_price(it.get('target'))}\n")
-                    f.write(f"- **Expected Return:** {fmt_pct(it.get('expected_return_pct'))}\n")
-                    f.write(f"- **Volatility (20d):** {it.get('volatility')}\n")
-                    f.write(f"- **Risk:** {it.get('risk')}\n")
-                    f.write(f"- **Sector:** {it.get('sector')}\n")
-                    f.write(f"- **Rationale:** {it.get('rationale')}\n\n")
+                f.write(md_text)
         except Exception:
             logger.exception("Failed to write markdown report to %s", md_path)
 
-        # HTML wrapper (safe showing of markdown)
+        # HTML wrapper (safe showing of markdown), rendered from the in-memory markdown
         html_path = folder / f"{mode}_report_{timestamp}.html"
         try:
-            with open(md_path, "r", encoding="utf-8") as fh:
-                md_text = fh.read()
             html_content = self._render_html(md_text, title=f"{mode.capitalize()} Report {timestamp}")
             with open(html_path, "w", encoding="utf-8") as fh:
                 fh.write(html_content)
@@ -208,7 +237,8 @@ class ReportGenerator:
             "folder": str(folder),
             "top": top,
             "all": all_items,
-            "timestamp": timestamp
+            "timestamp": timestamp,
+            "markdown": md_text
         }
 
     def _render_html(self, markdown_text: str, title: str = "Report") -> str:
@@ -220,10 +250,10 @@ class ReportGenerator:
         tr:nth-child(even) { background-color: #f9f9f9; }
         pre { white-space: pre-wrap; font-family: monospace; }
         """
-        html = f"""<!doctype html>
+        page = f"""<!doctype html>
 <html><head><meta charset="utf-8"/><title>{title}</title><style>{css}</style></head>
-<body><h1>{title}</h1><div><pre>{markdown_text}</pre></div></body></html>"""
-        return html
+<body><h1>{title}</h1><div><pre>{html.escape(markdown_text, quote=False)}</pre></div></body></html>"""
+        return page
 
     def send_email_with_report(self, report_meta: dict, top_n: int = 5):
         """
@@ -238,16 +268,6 @@ class ReportGenerator:
         html_path = Path(report_meta.get("report_html", ""))
         csv_path = Path(report_meta.get("report_csv", ""))
 
-        # compose HTML body from markdown for email (reuse renderer)
-        md_text = ""
-        try:
-            if md_path.exists():
-                md_text = md_path.read_text(encoding="utf-8")
-        except Exception:
-            logger.exception("Failed reading markdown for email body: %s", md_path)
-
-        html_body = self._render_html(md_text, title=f"Stock Picks {report_meta.get('timestamp')}")
-
         # Get credentials from environment
         email_user = os.environ.get("EMAIL_USERNAME")
         email_pass = os.environ.get("EMAIL_PASSWORD")
@@ -281,6 +301,17 @@ class ReportGenerator:
             logger.warning("Email credentials incomplete; skipping email.")
             return
 
+        # compose HTML body from markdown for email (reuse renderer); only once we know an email will be sent.
+        # The markdown normally comes in memory from generate_report; the file is the fallback.
+        md_text = report_meta.get("markdown", "")
+        try:
+            if not md_text and md_path.exists():
+                md_text = md_path.read_text(encoding="utf-8")
+        except Exception:
+            logger.exception("Failed reading markdown for email body: %s", md_path)
+
+        html_body = self._render_html(md_text, title=f"Stock Picks {report_meta.get('timestamp')}")
+
         # Build message
         msg = EmailMessage()
         msg["Subject"] = f"🔔 {report_meta.get('timestamp')} - {Path(report_meta.get('folder')).name} - Stock Picks"
@@ -292,12 +323,10 @@ class ReportGenerator:
         # Attach CSV if exists
         try:
             if csv_path.exists():
-                with open(csv_path, "rb") as f:
-                    part = MIMEBase("application", "octet-stream")
-                    part.set_payload(f.read())
-                    encoders.encode_base64(part)
-                    part.add_header("Content-Disposition", f"attachment; filename={csv_path.name}")
-                    msg.attach(part)
+                # EmailMessage API: base64-encodes once and nests the HTML alternative and the CSV
+                # correctly under multipart/mixed (attach() put the CSV inside multipart/alternative)
+                msg.add_attachment(csv_path.read_bytes(), maintype="application", subtype="octet-stream",
+                                   filename=csv_path.name)
         except Exception:
             logger.exception("Failed attaching CSV: %s", csv_path)
 
@@ -310,6 +339,20 @@ class ReportGenerator:
         except Exception:
             logger.exception("Failed to send email. If running in Actions, ensure EMAIL_USERNAME and EMAIL_PASSWORD are set as secrets.")
 
+    def _short_issue_summary(self, report_meta: dict, mode: str, timestamp: str) -> str:
+        """
+        Fallback issue body when the Markdown report is unavailable: one line per top-10 pick.
+        """
+        lines = [f"Automated **{mode}** picks for **{timestamp}**\n"]
+        for i, item in enumerate(report_meta.get("top", [])[:10], start=1):
+            get = item.get
+            target = get("target")
+            lines.append(
+                f"{i}. **{get('symbol')}** — Score: {get('score')} — {get('signals', {}).get('recommendation')} — "
+                f"Price: ₹{get('last_price')} — Target: {fmt_price(target) if target else 'N/A'}"
+            )
+        return "\n".join(lines)
+
     def create_github_issue_if_ci(self, report_meta: dict, mode: str = "daily"):
         """
         If running in GitHub Actions, create an issue using the generated Markdown report as the body.
@@ -332,42 +375,28 @@ class ReportGenerator:
         csv_path = Path(report_meta.get("report_csv", ""))
         timestamp = report_meta.get("timestamp", "")
 
-        # Read markdown report content (prefer the generated Markdown for the issue body)
-        body_md = ""
-        try:
-            if md_path.exists():
-                body_md = md_path.read_text(encoding="utf-8")
-            else:
-                # fallback: generate a short summary from report_meta['top']
-                top = report_meta.get("top", [])[:10]
-                lines = [f"Automated **{mode}** picks for **{timestamp}**\n"]
-                for i, item in enumerate(top, start=1):
-                    s = item.get("signals", {})
-                    lines.append(f"{i}. **{item.get('symbol')}** — Score: {item.get('score')} — {s.get('recommendation')} — Price: ₹{item.get('last_price')} — Target: {fmt_price(item.get('target')) if item.get('target') else 'N/A'}")
-                body_md = "\n".join(lines)
-        except Exception:
-            logger.exception("Failed to read markdown report; falling back to short summary.")
-            top = report_meta.get("top", [])[:10]
-            lines = [f"Automated **{mode}** picks for **{timestamp}**\n"]
-            for i, item in enumerate(top, start=1):
-                s = item.get("signals", {})
-                lines.append(f"{i}. **{item.get('symbol')}** — Score: {item.get('score')} — {s.get('recommendation')} — Price: ₹{item.get('last_price')} — Target: {fmt_price(item.get('target')) if item.get('target') else 'N/A'}")
-            body_md = "\n".join(lines)
-
-        # Prepend a small header/summary (counts)
+        # Markdown report content (prefer the generated Markdown for the issue body; in memory from generate_report)
+        body_md = report_meta.get("markdown", "")
+        if not body_md:
+            try:
+                if md_path.exists():
+                    body_md = md_path.read_text(encoding="utf-8")
+            except Exception:
+                logger.exception("Failed to read markdown report; falling back to short summary.")
+        if not body_md:
+            # fallback: generate a short summary from report_meta['top']
+            body_md = self._short_issue_summary(report_meta, mode, timestamp)
+
+        # Prepend a small header/summary (counts); the body is collected as fragments and joined once
         try:
             all_items = report_meta.get("all", [])
             total = len(all_items)
-            counts = {
-                "STRONG BUY": sum(1 for it in all_items if (it.get("signals") or {}).get("recommendation") == "STRONG BUY"),
-                "BUY": sum(1 for it in all_items if (it.get("signals") or {}).get("recommendation") == "BUY"),
-                "HOLD": sum(1 for it in all_items if (it.get("signals") or {}).get("recommendation") == "HOLD"),
-                "SELL": sum(1 for it in all_items if (it.get("signals") or {}).get("recommendation") == "SELL"),
-            }
+            # Single pass; items without a recommendation are not counted under any label
+            counts = Counter((it.get("signals") or {}).get("recommendation") for it in all_items)
             header = [f"Automated **{mode}** picks for **{timestamp}**", "", f"- Total scanned: {total}", f"- Strong Buy: {counts['STRONG BUY']}", f"- Buy: {counts['BUY']}", f"- Hold: {counts['HOLD']}", f"- Sell: {counts['SELL']}", ""]
-            full_body = "\n".join(header) + body_md
+            body_parts = ["\n".join(header), body_md]
         except Exception:
-            full_body = f"Automated **{mode}** picks for **{timestamp}**\n\n" + body_md
+            body_parts = [f"Automated **{mode}** picks for **{timestamp}**\n\n", body_md]
 
         # Append links to reports in repo (if folder exists)
         try:
@@ -384,11 +413,12 @@ class ReportGenerator:
                     link_lines.append(f"- [HTML report]({base_url}/{html_name})")
                 if csv_name:
                     link_lines.append(f"- [CSV export]({base_url}/{csv_name})")
-                full_body += "\n".join(link_lines)
+                body_parts.append("\n".join(link_lines))
             else:
-                full_body += "\n\n(Report files are in the runner workspace and will be committed to the repo if configured.)"
+                body_parts.append("\n\n(Report files are in the runner workspace and will be committed to the repo if configured.)")
         except Exception:
             logger.exception("Failed to append report links to issue body.")
+        full_body = "".join(body_parts)
 
         # Truncate if too long (safety)
         MAX_LEN = 60000  # conservative
@@ -407,9 +437,9 @@ class ReportGenerator:
         }
 
         url = f"https://api.github.com/repos/{repo}/issues"
-        headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github+json"}
+        headers = {"Authorization": f"Bearer {token}"}
         try:
-            r = requests.post(url, headers=headers, json=payload, timeout=30)
+            r = _gh_session.post(url, headers=headers, json=payload, timeout=30)
             if r.status_code in (200, 201):
                 logger.info("GitHub issue created (%s).", r.json().get("html_url"))
             else:
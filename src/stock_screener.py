@@ -1,6 +1,6 @@
 """
 stock_screener.py
-- Scoring stocks 0-100 using the existing weighted heuristic
+- Scoring stocks 0-100 using the existing weighted heuristic, vectorized across the universe (struct of arrays)
 - Adds timeframe-aware volatility lookbacks:
     daily -> 20
     weekly -> 40
@@ -14,31 +14,71 @@ stock_screener.py
 - Targets and target ranges sized using the volatility measure appropriate to the mode.
 - Returns sector, risk, rationale, expected_return_pct, target_low/high
 """
+import functools
 import logging
 from typing import Dict, Any
 from pathlib import Path
-import json
+from types import MappingProxyType
 import numpy as np
-import pandas as pd
-from ta.volatility import AverageTrueRange
+
+from src import ta_kernels
+from src.data_fetcher import load_config
+from src.technical_analysis import SCREENER_COLUMNS
 
 logger = logging.getLogger("stock_screener")
 logger.setLevel(logging.INFO)
 
 
-# Default mapping (trading days)
-DEFAULT_VOL_WINDOW = {
+# Default mapping (trading days); read-only since every screener without a custom map shares it
+DEFAULT_VOL_WINDOW = MappingProxyType({
     "daily": 20,         # ~1 month
     "weekly": 40,        # ~2 months
     "monthly": 60,       # ~3 months
     "quarterly": 60,     # quarter (3 months). use 60 to align with monthly medium-term.
     "biquarterly": 120,  # 6 months -> 120 trading days approx
     "yearly": 240        # ~1 year trading days (approx)
-}
+})
+
+DEFAULT_CONFIG_PATH = Path("config") / "stocks_list.json"
+
+# Categorical signals as int codes for the vectorized scorer; anything unlisted is code 1
+MACD_CODES = {"bearish_crossover": 0, "bullish_crossover": 2}
+TREND_CODES = {"down": 0, "up": 2}
+# Score factor per code: bearish/down, neutral/sideways/unknown, bullish/up
+CATEGORY_FACTORS = np.array([0.0, 0.4, 1.0])
+RISK_LABELS = np.array(["Low", "Medium", "High"], dtype=object)
+# Piecewise sub-scores as np.digitize lookup tables: SCORES[digitize(x, EDGES)].
+# NaN sorts past the last edge, so it takes the last score (as the scalar comparisons did).
+RSI_EDGES, RSI_SCORES = np.array([30.0, 45.0, 55.0, 70.0]), np.array([1.0, 0.8, 0.6, 0.3, 0.1])
+# momentum bins are closed on the right (digitize(..., right=True)): mom > 0.05 -> 1.0, etc.
+MOM_EDGES, MOM_SCORES = np.array([-0.01, 0.01, 0.05]), np.array([0.1, 0.4, 0.7, 1.0])
+BB_EDGES, BB_SCORES = np.array([0.2, 0.4, 0.6, 0.8]), np.array([1.0, 0.8, 0.5, 0.2, 0.0])
+# Rationale phrase per signal value; values without an entry add nothing
+_MACD_PHRASE = {"bullish_crossover": "MACD bullish crossover"}
+_RSI_PHRASE = {"oversold": "RSI oversold", "strong": "RSI strong"}
+
+
+@functools.lru_cache(maxsize=256)
+def _rationale(macd, rsi_sig, trend, vol_surge: bool) -> str:
+    """
+    Short rationale for one combination of signals; few distinct combinations occur per universe.
+    """
+    parts = []
+    if phrase := _MACD_PHRASE.get(macd):
+        parts.append(phrase)
+    if phrase := _RSI_PHRASE.get(rsi_sig):
+        parts.append(phrase)
+    if trend and trend != "unknown":
+        parts.append(f"Trend: {trend}")
+    if vol_surge:
+        parts.append("Volume surge")
+    if not parts:
+        return "No strong technical signals"
+    return "; ".join(parts[:2])
 
 
 class StockScreener:
-    def __init__(self, config_path: Path = Path("config") / "stocks_list.json", vol_window_map: Dict[str, int] = None):
+    def __init__(self, config_path: Path = DEFAULT_CONFIG_PATH, vol_window_map: Dict[str, int] = None):
         self.weights = {
             "rsi": 20,
             "macd": 20,
@@ -50,58 +90,70 @@ class StockScreener:
         self.config_path = Path(config_path)
         self.sectors = {}
         self.vol_window_map = vol_window_map or DEFAULT_VOL_WINDOW
+        # Volatility memo for scoring one universe under several modes: ATR keyed on the Close
+        # array, return std on (Close array, window). Reset when a different universe is scored.
+        self._atr_cache = {}
+        self._retstd_cache = {}
+        self._cache_universe = None
         self._load_config()
 
     def _load_config(self):
         try:
-            with open(self.config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-                self.sectors = config.get("sectors", {})
+            self.sectors = load_config(self.config_path).get("sectors", {})
         except Exception as e:
             logger.warning("Failed to load sectors from config: %s", e)
             self.sectors = {}
 
-    def _compute_atr_pct(self, df: pd.DataFrame):
+    def _arrays(self, info: Dict[str, Any]) -> Dict[str, np.ndarray]:
         """
-        ATR(14)/price as short-term volatility proxy.
+        Column arrays for one symbol: info["arrays"] as produced by TechnicalAnalyzer.to_arrays,
+        or the same columns pulled from info["df"] for callers that still pass a frame.
         """
-        try:
-            if df is None or df.empty or not {"High", "Low", "Close"}.issubset(df.columns):
-                return 0.0
-            atr = AverageTrueRange(high=df["High"], low=df["Low"], close=df["Close"], window=14)
-            atr_series = atr.average_true_range()
-            if atr_series is None or atr_series.empty:
-                return 0.0
-            atr_latest = float(atr_series.iloc[-1])
-            price = float(df["Close"].iloc[-1])
-            if price <= 0:
-                return 0.0
-            return max(0.0, atr_latest / price)
-        except Exception:
-            logger.exception("ATR computation failed")
+        arrays = info.get("arrays")
+        if arrays is not None:
+            return arrays
+        df = info.get("df")
+        if df is None:
+            return {}
+        return {c: df[c].to_numpy(dtype=np.float64) for c in SCREENER_COLUMNS if c in df.columns}
+
+    def _compute_atr_pct(self, arrays: Dict[str, np.ndarray]):
+        """
+        ATR(14)/price as short-term volatility proxy; 0.0 when it can't be computed.
+        Inputs are validated up front (TechnicalAnalyzer.to_arrays gives equal-length float64 columns).
+        """
+        # shorter histories have no ATR(14) yet
+        if not {"High", "Low", "Close"}.issubset(arrays) or len(arrays["Close"]) < 14:
+            return 0.0
+        price = float(arrays["Close"][-1])
+        if not price > 0:
             return 0.0
+        atr_latest = float(ta_kernels.atr(arrays["High"], arrays["Low"], arrays["Close"], window=14)[-1])
+        return max(0.0, atr_latest / price)
 
-    def _compute_return_std(self, df: pd.DataFrame, window: int):
+    def _compute_return_std(self, arrays: Dict[str, np.ndarray], window: int):
         """
-        Rolling std of daily returns over `window` days. Fallback safe returns.
+        Std of daily returns over the last `window` days (full history when shorter); 0.0 when undefined.
+        Only the last window+1 closes are touched unless the tail holds NaNs.
         """
-        try:
-            if df is None or df.empty or "Close" not in df.columns:
-                return 0.0
-            returns = df["Close"].pct_change().dropna()
-            if returns.empty:
-                return 0.0
-            if window < 2:
-                window = 2
-            val = returns.rolling(window=window, min_periods=5).std().iloc[-1]
-            if pd.isna(val):
-                val = returns.std()
-            return float(val) if not pd.isna(val) else 0.0
-        except Exception:
-            logger.exception("Return std computation failed")
+        close = arrays.get("Close")
+        if close is None or len(close) == 0:
             return 0.0
+        if window < 2:
+            window = 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tail = close[-(window + 1):]
+            returns = tail[1:] / tail[:-1] - 1.0
+            if returns.size < window or np.isnan(returns).any():
+                # short history or gaps: returns over the whole series with NaNs dropped
+                returns = close[1:] / close[:-1] - 1.0
+                returns = returns[~np.isnan(returns)][-window:]
+            if returns.size < 2:
+                return 0.0
+            val = returns.std(ddof=1)
+        return float(val) if np.isfinite(val) else 0.0
 
-    def _volatility_for_mode(self, df: pd.DataFrame, mode: str):
+    def _volatility_for_mode(self, arrays: Dict[str, np.ndarray], mode: str):
         """
         Determine volatility based on mode's window:
          - compute ATR_pct (short-term)
@@ -109,176 +161,183 @@ class StockScreener:
          - return the conservative max(atr_pct, ret_std)
         """
         vol_window = int(self.vol_window_map.get(mode, DEFAULT_VOL_WINDOW.get(mode, 20)))
-        atr_pct = self._compute_atr_pct(df)
-        ret_std = self._compute_return_std(df, vol_window)
+        close = arrays.get("Close")
+        atr_pct = self._cached(self._atr_cache, id(close), close, self._compute_atr_pct, arrays)
+        ret_std = self._cached(self._retstd_cache, (id(close), vol_window), close,
+                               self._compute_return_std, arrays, vol_window)
         # Conservative: pick the larger (more risk-aware)
         vol = max(atr_pct, ret_std)
         return vol, atr_pct, ret_std, vol_window
 
+    @staticmethod
+    def _cached(cache: dict, key, owner, fn, *args):
+        """
+        fn(*args) memoized in `cache`. Entries hold a reference to `owner` (the Close array) and only
+        hit for that same object, so a recycled id() can never return another symbol's value.
+        """
+        hit = cache.get(key)
+        if hit is not None and hit[0] is owner:
+            return hit[1]
+        val = fn(*args)
+        cache[key] = (owner, val)
+        return val
+
     def _rationale_from_signals(self, signals: Dict[str, Any]):
-        parts = []
-        macd = signals.get("macd_signal")
-        rsi_sig = signals.get("rsi_signal")
-        trend = signals.get("trend")
-        vol_surge = signals.get("volume_surge")
-        if macd == "bullish_crossover":
-            parts.append("MACD bullish crossover")
-        if rsi_sig in ("oversold", "strong"):
-            parts.append(f"RSI {rsi_sig}")
-        if trend and trend != "unknown":
-            parts.append(f"Trend: {trend}")
-        if vol_surge:
-            parts.append("Volume surge")
-        if not parts:
-            return "No strong technical signals"
-        return "; ".join(parts[:2])
+        return _rationale(signals.get("macd_signal"), signals.get("rsi_signal"), signals.get("trend"),
+                          bool(signals.get("volume_surge")))
 
-    def _risk_rating(self, score: float, vol: float):
+    def _risk_ratings(self, scores: np.ndarray, vols: np.ndarray) -> np.ndarray:
         """
-        Tuned thresholds — adjust as needed per your distribution.
+        Risk label per symbol, vectorized. Tuned thresholds — adjust as needed per your distribution.
         vol expected as a decimal (e.g., 0.03 ~ 3%)
         """
-        try:
-            if score < 40 or vol > 0.08:
-                return "High"
-            if vol > 0.04 or score < 65:
-                return "Medium"
-            return "Low"
-        except Exception:
-            return "Unknown"
+        codes = np.select([(scores < 40) | (vols > 0.08), (vols > 0.04) | (scores < 65)], [2, 1], default=0)
+        return RISK_LABELS[codes]
 
-    def score_universe(self, ta_results: Dict[str, Dict[str, Any]], mode: str = "daily"):
+    def _targets(self, last_prices: np.ndarray, resistances: np.ndarray, vols: np.ndarray):
         """
-        ta_results: { symbol: {"df": df, "signals": signals} }
-        mode: one of daily/weekly/monthly/quarterly/biquarterly/yearly
-        Returns dict {all: [...], top: [...]}
+        (target, target_low, target_high, expected_return_pct) arrays for every symbol at once.
+        Target: resistance * 1.03 when resistance is above the price, else price + 5%; the range is
+        +/- vol (floored at 1%) around it.
         """
-        scored = {}
-        mode = mode.lower()
-        for sym, info in ta_results.items():
-            signals = info.get("signals", {}) or {}
-            df = info.get("df")
-            score = 0.0
+        targets = np.where(resistances > last_prices, resistances * 1.03, last_prices * (1 + 0.05))
+        vol_used = np.maximum(vols, 0.01)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            exp_rets = (targets / last_prices - 1) * 100
+        return targets, targets * (1 - vol_used), targets * (1 + vol_used), exp_rets
 
-            # RSI scoring
-            rsi = signals.get("rsi", 50)
-            if rsi < 30:
-                score += 1.0 * self.weights["rsi"]
-            elif rsi < 45:
-                score += 0.8 * self.weights["rsi"]
-            elif rsi < 55:
-                score += 0.6 * self.weights["rsi"]
-            elif rsi < 70:
-                score += 0.3 * self.weights["rsi"]
-            else:
-                score += 0.1 * self.weights["rsi"]
-
-            # MACD
-            macd_sig = signals.get("macd_signal", "neutral")
-            if macd_sig == "bullish_crossover":
-                score += 1.0 * self.weights["macd"]
-            elif macd_sig == "bearish_crossover":
-                score += 0.0 * self.weights["macd"]
-            else:
-                score += 0.4 * self.weights["macd"]
+    def _signal_arrays(self, signals_list, arrays_list) -> Dict[str, np.ndarray]:
+        """
+        One pass over the per-symbol signals/arrays -> struct of arrays (one entry per symbol)
+        holding the scoring inputs, with categorical signals as small int codes.
+        """
+        n = len(signals_list)
+        rsi = np.empty(n)
+        macd = np.empty(n, dtype=np.int8)
+        trend = np.empty(n, dtype=np.int8)
+        vol_surge = np.empty(n, dtype=bool)
+        mom5 = np.empty(n)
+        mom20 = np.empty(n)
+        bb_pos = np.empty(n)
+        for i, (signals, arrays) in enumerate(zip(signals_list, arrays_list)):
+            get = signals.get
+            rsi[i] = get("rsi", 50)
+            macd[i] = MACD_CODES.get(get("macd_signal", "neutral"), 1)
+            trend[i] = TREND_CODES.get(get("trend", "unknown"), 1)
+            vol_surge[i] = bool(get("volume_surge"))
+            m5 = arrays.get("mom_5", ())
+            m20 = arrays.get("mom_20", ())
+            mom5[i] = m5[-1] if len(m5) > 0 else 0.0
+            mom20[i] = m20[-1] if len(m20) > 0 else 0.0
+            bb_pos[i] = get("bb_pos", 0.5) or 0.5
+        return {"rsi": rsi, "macd": macd, "trend": trend, "vol_surge": vol_surge,
+                "mom5": mom5, "mom20": mom20, "bb_pos": bb_pos}
 
-            # MA trend
-            trend = signals.get("trend", "unknown")
-            if trend == "up":
-                score += 1.0 * self.weights["ma_trend"]
-            elif trend == "down":
-                score += 0.0 * self.weights["ma_trend"]
-            else:
-                score += 0.4 * self.weights["ma_trend"]
+    def _score_arrays(self, sa: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Weighted 0-100 score for every symbol at once from the _signal_arrays struct.
+        NaN inputs fall through to the last bin, as the scalar comparisons did.
+        """
+        w = self.weights
+        rsi_s = RSI_SCORES[np.digitize(sa["rsi"], RSI_EDGES)]
+        # code -> factor: bearish/down 0.0, neutral/sideways/unknown 0.4, bullish/up 1.0
+        macd_s = CATEGORY_FACTORS[sa["macd"]]
+        trend_s = CATEGORY_FACTORS[sa["trend"]]
+        volume_s = np.where(sa["vol_surge"], 1.0, 0.3)
 
-            # Volume surge
-            score += (1.0 if signals.get("volume_surge") else 0.3) * self.weights["volume"]
+        # Momentum: mean of the available mom_5/mom_20 values, 0 when neither is
+        mom5, mom20 = sa["mom5"], sa["mom20"]
+        have5, have20 = ~np.isnan(mom5), ~np.isnan(mom20)
+        count = have5.astype(np.int8) + have20
+        mom = (np.where(have5, mom5, 0.0) + np.where(have20, mom20, 0.0)) / np.maximum(count, 1)
+        mom_s = MOM_SCORES[np.digitize(mom, MOM_EDGES, right=True)]
+        bb_s = BB_SCORES[np.digitize(sa["bb_pos"], BB_EDGES)]
 
-            # Momentum using mom_5/mom_20 if available
-            mom5 = df["mom_5"].iloc[-1] if (df is not None and "mom_5" in df.columns and len(df) > 0) else 0.0
-            mom20 = df["mom_20"].iloc[-1] if (df is not None and "mom_20" in df.columns and len(df) > 0) else 0.0
-            mom = np.nanmean([mom5, mom20])
-            if np.isnan(mom):
-                mom = 0.0
-            if mom > 0.05:
-                score += 1.0 * self.weights["momentum"]
-            elif mom > 0.01:
-                score += 0.7 * self.weights["momentum"]
-            elif mom > -0.01:
-                score += 0.4 * self.weights["momentum"]
-            else:
-                score += 0.1 * self.weights["momentum"]
+        score = (rsi_s * w["rsi"] + macd_s * w["macd"] + trend_s * w["ma_trend"]
+                 + volume_s * w["volume"] + mom_s * w["momentum"] + bb_s * w["bollinger"])
+        return np.clip(score, 0.0, 100.0)
 
-            # Bollinger position
-            bbpos = signals.get("bb_pos", 0.5) or 0.5
-            if bbpos < 0.2:
-                score += 1.0 * self.weights["bollinger"]
-            elif bbpos < 0.4:
-                score += 0.8 * self.weights["bollinger"]
-            elif bbpos < 0.6:
-                score += 0.5 * self.weights["bollinger"]
-            elif bbpos < 0.8:
-                score += 0.2 * self.weights["bollinger"]
-            else:
-                score += 0.0 * self.weights["bollinger"]
+    def score_universe(self, ta_results: Dict[str, Dict[str, Any]], mode: str = "daily"):
+        """
+        ta_results: { symbol: {"arrays": {column: ndarray}, "signals": signals} }
+                    ({"df": df, ...} is still accepted; see _arrays)
+        mode: one of daily/weekly/monthly/quarterly/biquarterly/yearly
+        Returns dict {all: [...], top: [...]}
+        The 0-100 scores are computed for the whole universe at once (_signal_arrays/_score_arrays);
+        targets are array math too; per-symbol work is limited to volatility and the result dict.
+        """
+        mode = mode.lower()
+        if id(ta_results) != self._cache_universe:
+            self._atr_cache.clear()
+            self._retstd_cache.clear()
+            self._cache_universe = id(ta_results)
+        symbols = list(ta_results)
+        signals_list = [ta_results[sym].get("signals", {}) or {} for sym in symbols]
+        arrays_list = [self._arrays(ta_results[sym]) for sym in symbols]
+        scores = self._score_arrays(self._signal_arrays(signals_list, arrays_list))
 
-            final_score = max(0.0, min(100.0, score))
+        # Volatility selection depending on mode (per symbol: ATR and return std need each history)
+        n = len(symbols)
+        vols, atr_pcts, ret_stds = np.empty(n), np.empty(n), np.empty(n)
+        vol_window = int(self.vol_window_map.get(mode, DEFAULT_VOL_WINDOW.get(mode, 20)))
+        for i, arrays in enumerate(arrays_list):
+            vols[i], atr_pcts[i], ret_stds[i], vol_window = self._volatility_for_mode(arrays, mode)
+        risks = self._risk_ratings(scores, vols)
 
-            # Last price
-            last_price = None
+        # Last price (the TA signal, else the last close) and 20-bar resistance per symbol
+        last_prices = np.full(n, np.nan)
+        has_price = np.zeros(n, dtype=bool)
+        resistances = np.full(n, np.nan)
+        for i, (signals, arrays) in enumerate(zip(signals_list, arrays_list)):
+            price = signals.get("price")
+            if price is None:
+                close = arrays.get("Close", ())
+                price = close[-1] if len(close) > 0 else None
             try:
-                last_price = float(signals.get("price") if signals.get("price") is not None else (df["Close"].iloc[-1] if (df is not None and "Close" in df.columns and len(df) > 0) else None))
+                last_prices[i] = float(price)
+                has_price[i] = True
             except Exception:
-                last_price = None
-
-            # Volatility selection depending on mode
-            vol, atr_pct, ret_std, vol_window = self._volatility_for_mode(df, mode)
-
-            # Basic target (resistance or +5%)
+                pass
             resistance = signals.get("resistance_20")
-            if last_price is not None:
-                if resistance and resistance > last_price:
-                    base_target = float(resistance * 1.03)
-                else:
-                    base_target = float(last_price * (1 + 0.05))
-            else:
-                base_target = None
+            if resistance:
+                resistances[i] = resistance
+        targets, target_lows, target_highs, exp_rets = self._targets(last_prices, resistances, vols)
 
-            target = base_target
-            target_low = None
-            target_high = None
-            expected_return_pct = None
-            if target is not None and last_price is not None:
-                # Range: +/- vol * multiplier
-                mult = 1.0
-                vol_used = max(vol, 0.01)  # floor to 1%
-                target_low = float(target * (1 - vol_used * mult))
-                target_high = float(target * (1 + vol_used * mult))
-                expected_return_pct = float((target / last_price - 1) * 100)
+        # Reported precision, applied once per metric (scores are multiples of 0.5, so never a rounding tie)
+        scores = np.round(scores, 1)
+        scored = []
+        for (sym, signals, final_score, vol, atr_pct, ret_std, risk,
+             has, last_price, target, target_low, target_high, expected_return_pct) in zip(
+                symbols, signals_list, scores.tolist(), np.round(vols, 4).tolist(), np.round(atr_pcts, 4).tolist(),
+                np.round(ret_stds, 4).tolist(), risks.tolist(), has_price.tolist(), last_prices.tolist(),
+                targets.tolist(), target_lows.tolist(), target_highs.tolist(), np.round(exp_rets, 2).tolist()):
+            if not has:
+                last_price = target = target_low = target_high = expected_return_pct = None
 
-            risk = self._risk_rating(final_score, vol)
             sector = self.sectors.get(sym, "Unknown")
             rationale = self._rationale_from_signals(signals)
 
-            scored[sym] = {
+            scored.append({
                 "symbol": sym,
-                "score": round(final_score, 1),
+                "score": final_score,
                 "signals": signals,
                 "last_price": last_price,
                 "target": target,
                 "target_low": target_low,
                 "target_high": target_high,
-                "expected_return_pct": None if expected_return_pct is None else round(expected_return_pct, 2),
-                "volatility": round(float(vol), 4),
-                "atr_pct": round(float(atr_pct), 4),
-                "ret_std": round(float(ret_std), 4),
+                "expected_return_pct": expected_return_pct,
+                "volatility": vol,
+                "atr_pct": atr_pct,
+                "ret_std": ret_std,
                 "vol_window": vol_window,
                 "risk": risk,
                 "sector": sector,
                 "rationale": rationale
-            }
+            })
 
-        # Sort & pick top
-        items = sorted(scored.values(), key=lambda x: x["score"], reverse=True)
+        # Sort & pick top: the report lists every symbol in score order, so the full ranking is needed
+        # (top is a slice of it). One stable argsort over the scores; ties keep universe order as before.
+        order = np.argsort(-scores, kind="stable")
+        items = [scored[i] for i in order]
         top_n = {"daily": 5, "weekly": 10, "monthly": 20, "quarterly": 20, "biquarterly": 30, "yearly": 50}.get(mode, 5)
         return {"all": items, "top": items[:top_n]}
@@ -0,0 +1,199 @@
+"""
+ta_kernels.py
+- Array kernels behind TechnicalAnalyzer.add_indicators (all indicators), modeling.prepare_features and the screener's ATR
+- Work on float64 ndarrays (one array per OHLCV field) instead of pandas objects
+- EMA-style recurrences run through scipy.signal.lfilter (a compiled first-order IIR filter),
+  rolling windows through numpy sliding views
+- Follow the `ta` library conventions (min_periods = window, adjust=False EMAs, Wilder RSI)
+  so the columns match what the `ta` indicator classes produced
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+
+def sma(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    Simple moving average; NaN until `window` values are available and wherever the window holds a NaN.
+    """
+    out = np.full(x.shape, np.nan)
+    if x.size >= window:
+        out[window - 1:] = sliding_window_view(x, window).mean(axis=1)
+    return out
+
+
+def pct_change(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    """
+    x[i] / x[i-periods] - 1; NaN for the first `periods` values (Series.pct_change without padding).
+    """
+    out = np.full(x.shape, np.nan)
+    if x.size > periods:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[periods:] = x[periods:] / x[:-periods] - 1.0
+    return out
+
+
+def rolling_std(x: np.ndarray, window: int, ddof: int = 1) -> np.ndarray:
+    """
+    Standard deviation (sample by default; ddof=0 for population) over a full window;
+    NaN where the window is short or holds a NaN; exactly 0 for a window of identical values.
+    O(n) in the window size: running sums of x and x**2 restarted every `window` bars and taken
+    about each block's own mean, so trends and large prices don't cancel the deviations away.
+    """
+    out = np.full(x.shape, np.nan)
+    n = x.size
+    if n < window or window <= ddof:
+        return out
+    # blocks of `window` bars (last one NaN-padded), centred on their own mean
+    nb = -(-n // window)
+    blocks = np.concatenate((x, np.full(nb * window - n, np.nan))).reshape(nb, window)
+    valid = ~np.isnan(blocks)
+    ref = np.where(valid, blocks, 0.0).sum(axis=1) / np.maximum(valid.sum(axis=1), 1)
+    d = np.where(valid, blocks - ref[:, None], 0.0)
+    p1 = np.cumsum(d, axis=1).ravel()[:n]
+    p2 = np.cumsum(d * d, axis=1).ravel()[:n]
+
+    # a window ending at i covers the head of i's block plus the tail of the previous block
+    # (empty when the window is exactly one block); the tail's sums are shifted onto this block's reference
+    ends = np.arange(window - 1, n)
+    start = ends - window + 1
+    blk = ends // window
+    head = blk * window
+    a1 = p1[head - 1] - p1[start - 1]
+    a2 = p2[head - 1] - p2[start - 1]
+    k = head - start
+    delta = ref[blk - 1] - ref[blk]
+    s1 = p1[ends] + a1 + k * delta
+    s2 = p2[ends] + a2 + 2.0 * delta * a1 + k * delta * delta
+    std = np.sqrt(np.maximum((s2 - s1 * s1 / window) / (window - ddof), 0.0))
+
+    # flat windows: no bar-to-bar change inside the window; NaN windows: any NaN inside it
+    changed = np.concatenate(([0], np.cumsum(x[1:] != x[:-1])))
+    std[changed[ends] - changed[start] == 0] = 0.0
+    bad = np.concatenate(([0], np.cumsum(np.isnan(x))))
+    std[bad[ends + 1] - bad[start] > 0] = np.nan
+    out[window - 1:] = std
+    return out
+
+
+def _rolling_extreme(x: np.ndarray, window: int, min_periods: int, reduce) -> np.ndarray:
+    # trailing windows (front-padded with NaN so the first bars get partial windows), reduced
+    # with a NaN-ignoring np.fmin/np.fmax; NaN where fewer than min_periods values are present
+    n = x.size
+    if n == 0:
+        return np.full(x.shape, np.nan)
+    padded = np.concatenate((np.full(window - 1, np.nan), x))
+    vals = reduce.reduce(sliding_window_view(padded, window), axis=1)
+    have = np.concatenate(([0], np.cumsum(~np.isnan(padded))))
+    count = have[window:] - have[:-window]
+    return np.where(count >= min_periods, vals, np.nan)
+
+
+def rolling_min(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """
+    Trailing-window minimum ignoring NaNs (Series.rolling(window, min_periods).min()).
+    """
+    return _rolling_extreme(x, window, window if min_periods is None else min_periods, np.fmin)
+
+
+def rolling_max(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """
+    Trailing-window maximum ignoring NaNs (Series.rolling(window, min_periods).max()).
+    """
+    return _rolling_extreme(x, window, window if min_periods is None else min_periods, np.fmax)
+
+
+def ewm(x: np.ndarray, alpha: float, min_periods: int) -> np.ndarray:
+    """
+    Recursive EWM y[i] = alpha*x[i] + (1-alpha)*y[i-1], seeded with the first valid value
+    (pandas ewm(adjust=False)). Leading NaNs are skipped; series with gaps after the first
+    valid value defer to pandas so its NaN-weighting rules are kept.
+    """
+    out = np.full(x.shape, np.nan)
+    valid = ~np.isnan(x)
+    if not valid.any():
+        return out
+    start = int(np.argmax(valid))
+    tail = x[start:]
+    if not valid[start:].all():
+        return pd.Series(x).ewm(alpha=alpha, min_periods=min_periods, adjust=False).mean().to_numpy()
+    y, _ = lfilter([alpha], [1.0, alpha - 1.0], tail, zi=[(1.0 - alpha) * tail[0]])
+    out[start:] = y
+    out[start:start + max(min_periods - 1, 0)] = np.nan
+    return out
+
+
+def ema(x: np.ndarray, span: int) -> np.ndarray:
+    """
+    Exponential moving average with alpha = 2/(span+1); NaN for the first span-1 values.
+    """
+    return ewm(x, 2.0 / (span + 1), span)
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9,
+         ema_fast: np.ndarray = None, ema_slow: np.ndarray = None):
+    """
+    (macd, macd_signal, macd_diff) as ta.trend.MACD: EMA(fast) - EMA(slow), its EMA(signal), and the difference.
+    Pass `ema_fast`/`ema_slow` when those EMAs are already computed.
+    """
+    if ema_fast is None:
+        ema_fast = ema(close, fast)
+    if ema_slow is None:
+        ema_slow = ema(close, slow)
+    line = ema_fast - ema_slow
+    sig = ema(line, signal)
+    return line, sig, line - sig
+
+
+def bollinger(close: np.ndarray, window: int = 20, window_dev: float = 2.0, mavg: np.ndarray = None):
+    """
+    (hband, lband, mavg) as ta.volatility.BollingerBands: SMA +/- window_dev population std devs.
+    Pass `mavg` when the window SMA is already computed.
+    """
+    if mavg is None:
+        mavg = sma(close, window)
+    dev = window_dev * rolling_std(close, window, ddof=0)
+    return mavg + dev, mavg - dev, mavg
+
+
+def rsi(close: np.ndarray, window: int = 14) -> np.ndarray:
+    """
+    Wilder RSI: gains/losses smoothed with alpha = 1/window; 100 when there are no losses.
+    """
+    diff = np.empty(close.shape)
+    diff[:1] = np.nan
+    diff[1:] = close[1:] - close[:-1]
+    # NaN diffs (first bar, gaps) count as no move, same as diff.where(diff > 0, 0.0)
+    up = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+    avg_up = ewm(up, 1.0 / window, window)
+    avg_down = ewm(down, 1.0 / window, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = 100.0 - 100.0 / (1.0 + avg_up / avg_down)
+    out[avg_down == 0] = 100.0
+    return out
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, window: int = 14) -> np.ndarray:
+    """
+    Wilder ATR as in ta.volatility.AverageTrueRange: seeded with the mean true range of the first
+    `window` bars, then atr[i] = (atr[i-1]*(window-1) + tr[i]) / window. NaN before the seed.
+    """
+    out = np.full(close.shape, np.nan)
+    if close.size < window:
+        return out
+    prev_close = np.empty(close.shape)
+    prev_close[:1] = np.nan
+    prev_close[1:] = close[:-1]
+    # max of the three ranges ignoring NaNs (the first bar has no previous close)
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    head = tr[:window]
+    n_valid = np.count_nonzero(~np.isnan(head))
+    seed = np.where(np.isnan(head), 0.0, head).sum() / n_valid if n_valid else np.nan
+    out[window - 1] = seed
+    if close.size > window:
+        decay = (window - 1) / window
+        y, _ = lfilter([1.0 / window], [1.0, -decay], tr[window:], zi=[decay * seed])
+        out[window:] = y
+    return out
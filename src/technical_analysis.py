@@ -1,18 +1,34 @@
 """
 technical_analysis.py
 - Adds SMA(20,50), EMA(12,26), RSI(14), MACD, Bollinger Bands
+- All indicators come from the ndarray kernels in ta_kernels.py (no per-indicator pandas objects)
 - Identifies basic support/resistance (simple pivots), trend direction and volume analysis
 - Generates basic buy/sell/hold signals
 """
 import logging
 import pandas as pd
 import numpy as np
-from ta.trend import SMAIndicator, EMAIndicator, MACD
-from ta.momentum import RSIIndicator
-from ta.volatility import BollingerBands
+
+from src import ta_kernels
 
 logger = logging.getLogger("technical_analysis")
 
+# Columns the screener reads from the TA frame; shipped downstream as plain ndarrays
+SCREENER_COLUMNS = ("High", "Low", "Close", "mom_5", "mom_20")
+# Values of the "trend" column, in Categorical code order
+TREND_CATEGORIES = ("unknown", "sideways", "up", "down")
+# Recommendation for 0..4 bullish points in generate_signals
+RECOMMENDATION_BY_POINTS = ("SELL", "HOLD", "BUY", "STRONG BUY", "STRONG BUY")
+
+
+def _ensure_numeric(col):
+    """
+    Numeric columns pass through untouched; anything else is coerced (bad values -> NaN).
+    """
+    if getattr(col, "dtype", None) is not None and col.dtype.kind in "iuf":
+        return col
+    return pd.to_numeric(col, errors="coerce")
+
 
 class TechnicalAnalyzer:
     def __init__(self):
@@ -21,68 +37,83 @@ class TechnicalAnalyzer:
     def add_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Input df: index=Date, columns include Open/High/Low/Close/Volume
-        Adds columns for indicators and returns the augmented dataframe.
+        Returns a new dataframe with the indicator columns added; the input is left untouched.
         """
-        df = df.copy()
         if "Close" not in df.columns:
             raise ValueError("DataFrame missing Close column")
 
+        # New columns are collected here and attached with one df.assign at the end,
+        # which returns a new frame: the caller's df is never mutated, so no up-front copy.
+        cols = {}
+
         # Ensure numeric
-        df["Close"] = pd.to_numeric(df["Close"], errors="coerce")
-        df["Volume"] = pd.to_numeric(df.get("Volume", 0), errors="coerce").fillna(0)
+        close_s = _ensure_numeric(df["Close"])
+        cols["Close"] = close_s
+        cols["Volume"] = _ensure_numeric(df.get("Volume", 0)).fillna(0)
+
+        close = close_s.to_numpy(dtype=np.float64)
 
         # SMA
-        df["sma_20"] = SMAIndicator(close=df["Close"], window=20).sma_indicator()
-        df["sma_50"] = SMAIndicator(close=df["Close"], window=50).sma_indicator()
+        sma_20 = ta_kernels.sma(close, 20)
+        sma_50 = ta_kernels.sma(close, 50)
+        cols["sma_20"] = sma_20
+        cols["sma_50"] = sma_50
 
         # EMA
-        df["ema_12"] = EMAIndicator(close=df["Close"], window=12).ema_indicator()
-        df["ema_26"] = EMAIndicator(close=df["Close"], window=26).ema_indicator()
+        ema_12 = ta_kernels.ema(close, 12)
+        ema_26 = ta_kernels.ema(close, 26)
+        cols["ema_12"] = ema_12
+        cols["ema_26"] = ema_26
 
         # RSI
-        rsi = RSIIndicator(close=df["Close"], window=14)
-        df["rsi_14"] = rsi.rsi()
+        cols["rsi_14"] = ta_kernels.rsi(close, 14)
 
         # MACD
-        macd = MACD(close=df["Close"], window_slow=26, window_fast=12, window_sign=9)
-        df["macd"] = macd.macd()
-        df["macd_signal"] = macd.macd_signal()
-        df["macd_diff"] = df["macd"] - df["macd_signal"]
-
-        # Bollinger Bands
-        bb = BollingerBands(close=df["Close"], window=20, window_dev=2)
-        df["bb_hband"] = bb.bollinger_hband()
-        df["bb_lband"] = bb.bollinger_lband()
-        df["bb_mavg"] = bb.bollinger_mavg()
-        # Position within bands: 0 (lower) to 1 (upper)
-        df["bb_pos"] = (df["Close"] - df["bb_lband"]) / (df["bb_hband"] - df["bb_lband"] + 1e-9)
+        # MACD line reuses the EMA(12)/EMA(26) columns above; only its EMA(9) signal is new work
+        cols["macd"], cols["macd_signal"], cols["macd_diff"] = ta_kernels.macd(close, 12, 26, 9,
+                                                                              ema_fast=ema_12, ema_slow=ema_26)
+
+        # Bollinger Bands (the 20-bar mean is sma_20)
+        bb_hband, bb_lband, bb_mavg = ta_kernels.bollinger(close, 20, 2, mavg=sma_20)
+        cols["bb_hband"] = bb_hband
+        cols["bb_lband"] = bb_lband
+        cols["bb_mavg"] = bb_mavg
+        # Position within bands: 0 (lower) to 1 (upper); 0.5 (mid-band) where the bands have
+        # collapsed (flat window), NaN while the bands are still warming up
+        band_width = bb_hband - bb_lband
+        cols["bb_pos"] = np.divide(close - bb_lband, band_width,
+                                   out=np.where(np.isnan(band_width), np.nan, 0.5), where=band_width > 1e-12)
 
         # Price momentum: percent change over 5/20 days
-        df["mom_5"] = df["Close"].pct_change(5)
-        df["mom_20"] = df["Close"].pct_change(20)
+        cols["mom_5"] = ta_kernels.pct_change(close, 5)
+        cols["mom_20"] = ta_kernels.pct_change(close, 20)
 
         # Simple support/resistance: local mins/maxs over rolling window
-        df["spt_20"] = df["Low"].rolling(window=20, min_periods=5).min()
-        df["res_20"] = df["High"].rolling(window=20, min_periods=5).max()
+        cols["spt_20"] = ta_kernels.rolling_min(df["Low"].to_numpy(dtype=np.float64), 20, min_periods=5)
+        cols["res_20"] = ta_kernels.rolling_max(df["High"].to_numpy(dtype=np.float64), 20, min_periods=5)
 
         # Trend direction: based on SMA slopes
-        df["sma20_slope"] = df["sma_20"].diff()
-        df["sma50_slope"] = df["sma_50"].diff()
-        df["trend"] = df.apply(self._detect_trend, axis=1)
-
-        return df
-
-    def _detect_trend(self, row):
-        try:
-            if pd.isna(row["sma_20"]) or pd.isna(row["sma_50"]):
-                return "unknown"
-            if row["sma_20"] > row["sma_50"] and row["sma20_slope"] > 0:
-                return "up"
-            if row["sma_20"] < row["sma_50"] and row["sma20_slope"] < 0:
-                return "down"
-            return "sideways"
-        except Exception:
-            return "unknown"
+        cols["sma20_slope"] = np.diff(sma_20, prepend=np.nan)
+        cols["sma50_slope"] = np.diff(sma_50, prepend=np.nan)
+
+        # Trend: unknown until both SMAs exist, then up/down when the SMA order and sma_20's slope agree
+        slope_20 = cols["sma20_slope"]
+        # stored as a Categorical (int8 codes into TREND_CATEGORIES) rather than one str object per bar
+        codes = np.select(
+            [np.isnan(sma_20) | np.isnan(sma_50),
+             (sma_20 > sma_50) & (slope_20 > 0),
+             (sma_20 < sma_50) & (slope_20 < 0)],
+            [0, 2, 3], default=1).astype(np.int8)
+        cols["trend"] = pd.Categorical.from_codes(codes, categories=TREND_CATEGORIES)
+
+        return df.assign(**cols)
+
+    def to_arrays(self, df: pd.DataFrame, columns=SCREENER_COLUMNS) -> dict:
+        """
+        Struct-of-arrays view of a TA frame: {column: float64 ndarray} for the given columns.
+        Much cheaper to keep around and to pickle between processes than the full DataFrame.
+        """
+        return {c: df[c].to_numpy(dtype=np.float64) for c in columns if c in df.columns}
 
     def generate_signals(self, df: pd.DataFrame) -> dict:
         """
@@ -91,12 +122,25 @@ class TechnicalAnalyzer:
         if df.empty:
             return {}
 
-        latest = df.iloc[-1]
-        prev = df.iloc[-2] if len(df) > 1 else latest
+        # Scalars are read straight from the column arrays (no row Series per lookup);
+        # each column is converted once, on first use
+        last = len(df) - 1
+        prev = max(last - 1, 0)
+        columns = df.columns
+        arrays = {}
+
+        def column(col):
+            arr = arrays.get(col)
+            if arr is None:
+                arr = arrays[col] = df[col].to_numpy()
+            return arr
+
+        def at(col, i, default=None):
+            return column(col)[i] if col in columns else default
 
         signals = {}
         # RSI
-        rsi = latest.get("rsi_14", None)
+        rsi = at("rsi_14", last)
         signals["rsi"] = rsi
         signals["rsi_signal"] = "neutral"
         if pd.notna(rsi):
@@ -110,8 +154,8 @@ class TechnicalAnalyzer:
                 signals["rsi_signal"] = "strong"
 
         # MACD crossover
-        macd_diff = latest.get("macd_diff", None)
-        prev_diff = prev.get("macd_diff", None)
+        macd_diff = at("macd_diff", last)
+        prev_diff = at("macd_diff", prev)
         signals["macd_diff"] = macd_diff
         if pd.notna(macd_diff) and pd.notna(prev_diff):
             if prev_diff < 0 and macd_diff > 0:
@@ -124,44 +168,36 @@ class TechnicalAnalyzer:
             signals["macd_signal"] = "unknown"
 
         # Moving averages status
-        signals["price"] = latest.get("Close", None)
-        signals["above_sma20"] = bool(latest.get("Close", 0) > latest.get("sma_20", float("inf")))
-        signals["above_sma50"] = bool(latest.get("Close", 0) > latest.get("sma_50", float("inf")))
-        signals["trend"] = latest.get("trend", "unknown")
+        signals["price"] = at("Close", last)
+        # Latest values as Python floats; a NaN on either side compares False
+        close_l = float(at("Close", last, 0))
+        signals["above_sma20"] = close_l > float(at("sma_20", last, np.inf))
+        signals["above_sma50"] = close_l > float(at("sma_50", last, np.inf))
+        # one label straight from the Categorical, without expanding its codes to an object array
+        signals["trend"] = df["trend"].iat[last] if "trend" in columns else "unknown"
 
         # Volume: compare to 20-day average
-        vol = latest.get("Volume", 0)
-        vol_avg = df["Volume"].rolling(window=20, min_periods=5).mean().iloc[-1]
+        vol = at("Volume", last, 0)
+        # mean of the last 20 bars' valid volumes (at least 5), as rolling(20, min_periods=5).mean().iloc[-1]
+        vol_tail = column("Volume")[-20:].astype(np.float64)
+        vol_tail = vol_tail[~np.isnan(vol_tail)]
+        vol_avg = vol_tail.mean() if vol_tail.size >= 5 else np.nan
         signals["volume"] = vol
         signals["vol_avg_20"] = vol_avg
         signals["volume_surge"] = bool(vol_avg > 0 and vol > vol_avg * 1.5)
 
         # Bollinger position
-        signals["bb_pos"] = latest.get("bb_pos", None)
+        signals["bb_pos"] = at("bb_pos", last)
 
         # Support/resistance
-        signals["support_20"] = latest.get("spt_20", None)
-        signals["resistance_20"] = latest.get("res_20", None)
-
-        # Buy/Sell/Hold heuristic
-        score_buy = 0
-        # simple rules
-        if signals.get("macd_signal") == "bullish_crossover":
-            score_buy += 1
-        if signals.get("rsi_signal") in ("oversold", "strong"):
-            score_buy += 1
-        if signals.get("trend") == "up":
-            score_buy += 1
-        if signals.get("volume_surge"):
-            score_buy += 1
-        # map to recommendation
-        if score_buy >= 3:
-            signals["recommendation"] = "STRONG BUY"
-        elif score_buy == 2:
-            signals["recommendation"] = "BUY"
-        elif score_buy == 1:
-            signals["recommendation"] = "HOLD"
-        else:
-            signals["recommendation"] = "SELL"
+        signals["support_20"] = at("spt_20", last)
+        signals["resistance_20"] = at("res_20", last)
+
+        # Buy/Sell/Hold heuristic: one point per bullish rule, mapped through RECOMMENDATION_BY_POINTS
+        points = (int(signals["macd_signal"] == "bullish_crossover")
+                  + int(signals["rsi_signal"] in ("oversold", "strong"))
+                  + int(signals["trend"] == "up")
+                  + int(signals["volume_surge"]))
+        signals["recommendation"] = RECOMMENDATION_BY_POINTS[points]
 
         return signals
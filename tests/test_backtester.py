@@ -0,0 +1,29 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.backtester import run_simple_long_backtest
+
+
+class MixedTimezoneTest(unittest.TestCase):
+    def setUp(self):
+        idx = pd.date_range("2024-01-01", periods=30, freq="B")
+        self.naive = pd.Series(np.arange(1.0, 31.0), index=idx)
+        self.aware = self.naive.tz_localize("Asia/Kolkata")
+
+    def test_naive_dates_on_aware_index(self):
+        got = run_simple_long_backtest(self.aware, [pd.Timestamp("2024-01-03")], hold_days=5)
+        expected = run_simple_long_backtest(self.aware, [pd.Timestamp("2024-01-03", tz="Asia/Kolkata")], hold_days=5)
+        self.assertEqual(got["trades"], 1)
+        self.assertEqual(got["total_return"], expected["total_return"])
+
+    def test_aware_dates_on_naive_index(self):
+        got = run_simple_long_backtest(self.naive, [pd.Timestamp("2024-01-03", tz="Asia/Kolkata")], hold_days=5)
+        expected = run_simple_long_backtest(self.naive, [pd.Timestamp("2024-01-03")], hold_days=5)
+        self.assertEqual(got["trades"], 1)
+        self.assertEqual(got["total_return"], expected["total_return"])
+
+
+if __name__ == "__main__":
+    unittest.main()
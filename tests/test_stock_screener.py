@@ -0,0 +1,38 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.stock_screener import StockScreener
+from src.technical_analysis import TechnicalAnalyzer
+
+
+def _ohlcv(close):
+    idx = pd.date_range("2024-01-01", periods=len(close), freq="B")
+    close = np.asarray(close, dtype=np.float64)
+    return pd.DataFrame({"Open": close, "High": close, "Low": close, "Close": close,
+                         "Volume": np.full(len(close), 1000.0)}, index=idx)
+
+
+class BollingerScoreTest(unittest.TestCase):
+    def _score(self, df, bb_pos=None):
+        analyzer = TechnicalAnalyzer()
+        ta_df = analyzer.add_indicators(df)
+        signals = analyzer.generate_signals(ta_df)
+        if bb_pos is not None:
+            signals["bb_pos"] = bb_pos
+        screener = StockScreener()
+        sa = screener._signal_arrays([signals], [analyzer.to_arrays(ta_df)])
+        return signals, screener._score_arrays(sa)[0]
+
+    def test_flat_tail_scores_mid_band(self):
+        # 80 trending bars, then a flat 20-bar tail at a price the trend never rounds to exactly
+        df = _ohlcv(np.concatenate((np.linspace(250.0, 300.0, 80), np.full(20, 1401.37))))
+        signals, score = self._score(df)
+        self.assertEqual(signals["bb_pos"], 0.5)
+        _, neutral = self._score(df, bb_pos=0.5)
+        self.assertEqual(score, neutral)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import ta_kernels
+
+
+def _series(n, seed=0, gaps=()):
+    x = 100.0 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0.0, 0.02, n)))
+    x[list(gaps)] = np.nan
+    return x
+
+
+# Reference formulas, as the `ta` indicator classes computed them with pandas
+def _ta_ema(x, span):
+    return pd.Series(x).ewm(span=span, min_periods=span, adjust=False).mean().to_numpy()
+
+
+def _ta_rsi(x, window):
+    diff = pd.Series(x).diff(1)
+    up = diff.where(diff > 0, 0.0)
+    down = -diff.where(diff < 0, 0.0)
+    avg_up = up.ewm(alpha=1 / window, min_periods=window, adjust=False).mean()
+    avg_down = down.ewm(alpha=1 / window, min_periods=window, adjust=False).mean()
+    return np.where(avg_down == 0, 100.0, 100 - 100 / (1 + avg_up / avg_down))
+
+
+def _ta_atr(high, low, close, window):
+    prev_close = pd.Series(close).shift(1)
+    tr = pd.DataFrame({"hl": high - low, "hc": (pd.Series(high) - prev_close).abs(),
+                       "lc": (pd.Series(low) - prev_close).abs()}).max(axis=1).to_numpy()
+    out = np.full(close.size, np.nan)
+    if close.size < window:
+        return out
+    out[window - 1] = pd.Series(tr[:window]).mean()
+    for i in range(window, close.size):
+        out[i] = (out[i - 1] * (window - 1) + tr[i]) / window
+    return out
+
+
+class RollingStdTest(unittest.TestCase):
+    def test_matches_pandas(self):
+        x = np.random.default_rng(0).normal(100.0, 5.0, 300)
+        x[7] = np.nan
+        for ddof in (0, 1):
+            expected = pd.Series(x).rolling(20).std(ddof=ddof).to_numpy()
+            np.testing.assert_allclose(ta_kernels.rolling_std(x, 20, ddof=ddof), expected, rtol=1e-10)
+
+    def test_trending_large_prices(self):
+        # 1e5-scale trend with small noise: the deviations must survive the large level
+        rng = np.random.default_rng(1)
+        x = np.linspace(1e5, 2e5, 500) + rng.normal(0.0, 1.0, 500)
+        expected = pd.Series(x).rolling(20).std(ddof=0).to_numpy()
+        np.testing.assert_allclose(ta_kernels.rolling_std(x, 20, ddof=0), expected, rtol=1e-6)
+
+    def test_flat_window_is_zero(self):
+        # flat tails after a long trend at large and small price scales
+        for level, trend in ((280.35, np.linspace(250.0, 300.0, 200)), (1.4e5 + 0.1, np.linspace(1e5, 2e5, 200))):
+            x = np.concatenate((trend, np.full(25, level)))
+            std = ta_kernels.rolling_std(x, 20, ddof=0)
+            self.assertTrue(np.all(std[-6:] == 0.0))
+
+    def test_short_series_is_nan(self):
+        self.assertTrue(np.isnan(ta_kernels.rolling_std(np.arange(5.0), 20)).all())
+
+
+class IndicatorKernelTest(unittest.TestCase):
+    # a clean series, one with NaN gaps after the warm-up, and one shorter than every window
+    CASES = {"clean": _series(300), "gaps": _series(300, seed=1, gaps=(40, 41, 120, 250)), "short": _series(8)}
+
+    def assert_matches(self, got, expected):
+        np.testing.assert_allclose(got, expected, rtol=1e-10, atol=1e-12)
+
+    def test_sma(self):
+        for name, x in self.CASES.items():
+            with self.subTest(name):
+                self.assert_matches(ta_kernels.sma(x, 20), pd.Series(x).rolling(20, min_periods=20).mean().to_numpy())
+
+    def test_ema(self):
+        for name, x in self.CASES.items():
+            with self.subTest(name):
+                self.assert_matches(ta_kernels.ema(x, 12), _ta_ema(x, 12))
+
+    def test_macd(self):
+        for name, x in self.CASES.items():
+            with self.subTest(name):
+                line = _ta_ema(x, 12) - _ta_ema(x, 26)
+                sig = _ta_ema(line, 9)
+                for got, expected in zip(ta_kernels.macd(x, 12, 26, 9), (line, sig, line - sig)):
+                    self.assert_matches(got, expected)
+
+    def test_bollinger(self):
+        for name, x in self.CASES.items():
+            with self.subTest(name):
+                roll = pd.Series(x).rolling(20, min_periods=20)
+                mavg, mstd = roll.mean().to_numpy(), roll.std(ddof=0).to_numpy()
+                hband, lband, mid = ta_kernels.bollinger(x, 20, 2)
+                self.assert_matches(mid, mavg)
+                self.assert_matches(hband, mavg + 2 * mstd)
+                self.assert_matches(lband, mavg - 2 * mstd)
+
+    def test_rsi(self):
+        for name, x in self.CASES.items():
+            with self.subTest(name):
+                self.assert_matches(ta_kernels.rsi(x, 14), _ta_rsi(x, 14))
+
+    def test_rsi_without_losses_is_100(self):
+        rsi = ta_kernels.rsi(np.arange(1.0, 40.0), 14)
+        self.assertTrue(np.all(rsi[14:] == 100.0))
+
+    def test_atr(self):
+        for name, close in self.CASES.items():
+            with self.subTest(name):
+                rng = np.random.default_rng(2)
+                high = close * (1 + rng.uniform(0.0, 0.03, close.size))
+                low = close * (1 - rng.uniform(0.0, 0.03, close.size))
+                self.assert_matches(ta_kernels.atr(high, low, close, 14), _ta_atr(high, low, close, 14))
+
+
+if __name__ == "__main__":
+    unittest.main()